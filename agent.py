@@ -1,7 +1,12 @@
 # agent.py
-from pydantic_ai import Agent
+import os
+from pydantic_ai import Agent, Tool
 from pydantic_ai.models.gemini import GeminiModel
 from tools import SearchTools
+from answer_cache import CachedAgent
+
+# Opt-in: answer near-duplicate questions from earlier answers
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "0") == "1"
 
 SYSTEM_PROMPT = """
 You are a helpful assistant that answers questions about documentation.  
@@ -12,20 +17,28 @@ If you can find specific information through search, use it to provide accurate
 
 Rules:
 - ALWAYS search before answering
-- Decide whether the question is about learning material or assignments
+- Decide whether the question is about learning material or assignments, and pass content_type="learning" or content_type="assignment" to the search when it clearly is
+- Search results are short snippets; when one looks relevant but is cut off ("truncated": true), call get_section with its chunk_id to read the full section
 - Answer ONLY using retrieved content
 - If the search doesn't return relevant results, let the user know and provide general guidance.
 """
 
-def build_agent(search_tools: SearchTools):
+def build_agent(search_tools: SearchTools, answer_cache: bool = ANSWER_CACHE):
     model = GeminiModel(
         model_name="gemini-2.5-flash"
     )
-    return Agent(
+    agent = Agent(
         name="repo_agent",
         instructions=SYSTEM_PROMPT,
         tools=[
-            search_tools.hybrid_search
+            # Async variant, so searches don't block the event loop;
+            # registered under the original tool name
+            Tool(search_tools.hybrid_search_async, name="hybrid_search"),
+            Tool(search_tools.get_section, name="get_section"),
         ],
         model=model
     )
+
+    if answer_cache:
+        return CachedAgent(agent, search_tools)
+    return agent
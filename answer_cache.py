@@ -0,0 +1,164 @@
+# answer_cache.py
+import os
+import threading
+from contextlib import asynccontextmanager
+import numpy as np
+from collections import OrderedDict
+from typing import Optional
+
+from pydantic_ai.messages import ModelRequest, ModelResponse, TextPart, UserPromptPart
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.92))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", 256))
+
+
+class SemanticAnswerCache:
+    """
+    LRU of (question embedding, answer) pairs. A question whose cosine
+    similarity to a cached one is at least threshold reuses its answer.
+    Entries are tagged with the index version they were answered from;
+    a new version empties the cache.
+    """
+
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        maxsize: int = ANSWER_CACHE_SIZE,
+    ):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._version = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _check_version(self, version: str) -> None:
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def lookup(self, vector, version: str) -> Optional[str]:
+        with self._lock:
+            self._check_version(version)
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            ids = list(self._entries)
+            matrix = np.stack([self._entries[i][0] for i in ids])
+            scores = matrix @ self._unit(vector)
+            best = int(np.argmax(scores))
+
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(ids[best])
+            self.hits += 1
+            return self._entries[ids[best]][1]
+
+    def add(self, vector, answer: str, version: str) -> None:
+        with self._lock:
+            self._check_version(version)
+            self._entries[self._next_id] = (self._unit(vector), answer)
+            self._next_id += 1
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+class CachedRunResult:
+    """
+    Stands in for an agent run result on a cache hit.
+    """
+
+    cache_hit = True
+
+    def __init__(self, question: str, answer: str, model_name: str):
+        self.output = answer
+        self._messages = [
+            ModelRequest(parts=[UserPromptPart(content=question)]),
+            ModelResponse(parts=[TextPart(content=answer)], model_name=model_name),
+        ]
+
+    async def stream_text(self, delta: bool = False):
+        # Same interface as a streamed run; the answer arrives at once
+        yield self.output
+
+    async def get_output(self) -> str:
+        return self.output
+
+    def new_messages(self):
+        return list(self._messages)
+
+    def all_messages(self):
+        return list(self._messages)
+
+
+class CachedAgent:
+    """
+    Wraps an Agent with a semantic answer cache in front of run().
+    Everything else (name, model, toolsets, ...) is the wrapped agent's,
+    so logging works unchanged.
+    """
+
+    def __init__(self, agent, search_tools, cache: Optional[SemanticAnswerCache] = None):
+        self.agent = agent
+        self.search_tools = search_tools
+        self.cache = cache or SemanticAnswerCache()
+
+    def __getattr__(self, name):
+        return getattr(self.agent, name)
+
+    async def _embed(self, question: str):
+        # Reuses the search query-embedding cache and thread pool
+        return await self.search_tools.encode_query_async(question)
+
+    async def run(self, user_prompt: str, **kwargs):
+        # Follow-up turns depend on history, so they always go to the LLM;
+        # so does everything until the embedding model has loaded
+        if kwargs.get("message_history") or not self.search_tools.model_ready:
+            return await self.agent.run(user_prompt=user_prompt, **kwargs)
+
+        version = self.search_tools.version
+        vector = await self._embed(user_prompt)
+
+        answer = self.cache.lookup(vector, version)
+        if answer is not None:
+            return CachedRunResult(user_prompt, answer, self.agent.model.model_name)
+
+        result = await self.agent.run(user_prompt=user_prompt, **kwargs)
+        self.cache.add(vector, result.output, version)
+        return result
+
+    @asynccontextmanager
+    async def run_stream(self, user_prompt: str, **kwargs):
+        """
+        Streaming counterpart of run(): yields the cached result on a
+        hit, else the agent's streamed run, caching its final output.
+        """
+        if kwargs.get("message_history") or not self.search_tools.model_ready:
+            async with self.agent.run_stream(user_prompt=user_prompt, **kwargs) as result:
+                yield result
+            return
+
+        version = self.search_tools.version
+        vector = await self._embed(user_prompt)
+
+        answer = self.cache.lookup(vector, version)
+        if answer is not None:
+            yield CachedRunResult(user_prompt, answer, self.agent.model.model_name)
+            return
+
+        async with self.agent.run_stream(user_prompt=user_prompt, **kwargs) as result:
+            yield result
+            self.cache.add(vector, await result.get_output(), version)
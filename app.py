@@ -1,12 +1,13 @@
 import asyncio
+import queue
+import threading
+import time
 import streamlit as st
 import os
 # from dotenv import load_dotenv
 
-from ingest import load_raw_documents
-from chunking import chunk_documents
-from indexes import RepoIndexes
-from tools import SearchTools
+from metrics import startup, span, record_run_usage, start_metrics_server, METRICS_PORT
+from service import build_search_tools
 from agent import build_agent
 from logs import log_interaction_to_file
 # from eval import eval_agent, evaluate_log_record
@@ -30,21 +31,27 @@ st.caption("Ask questions about the repository")
 # -------------------------------------------------
 # Persistent event loop (CRITICAL)
 # -------------------------------------------------
+@st.cache_resource
 def get_event_loop():
-    if "event_loop" not in st.session_state:
-        st.session_state.event_loop = asyncio.new_event_loop()
-    return st.session_state.event_loop
+    # One long-lived loop on its own thread; sessions submit their
+    # streams to it, so a rerun never finds it busy
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="agent-loop", daemon=True).start()
+    return loop
 
 # -------------------------------------------------
 # Agent initialization (cached)
 # -------------------------------------------------
 @st.cache_resource
 def init_agent():
-    docs = load_raw_documents()
-    chunks = chunk_documents(docs)
-    indexes = RepoIndexes(chunks)
-    tools = SearchTools(indexes)
-    agent = build_agent(tools)
+    # Local indexes, or the shared search service if SEARCH_SERVICE_URL is set;
+    # the embedding model keeps loading in the background
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    tools = build_search_tools()
+    with startup.phase("build agent"):
+        agent = build_agent(tools)
+    startup.report()
     return agent
 
 
@@ -64,13 +71,53 @@ for msg in st.session_state.messages:
         st.markdown(msg["content"])
 
 # -------------------------------------------------
-# Sync wrapper for async agent
+# Sync generator over the async agent stream
 # -------------------------------------------------
-def run_agent(prompt: str):
+def stream_agent(prompt: str, run_info: dict):
+    """
+    Yields response text deltas for st.write_stream. The whole stream
+    runs as one task on the shared loop thread, traced and logged there
+    once it is done. If the generator is closed early (a rerun), the
+    task is cancelled.
+    """
     loop = get_event_loop()
-    return loop.run_until_complete(
-        agent.run(user_prompt=prompt)
-    )
+    deltas = queue.Queue()
+    done = object()
+
+    async def produce():
+        started = time.perf_counter()
+        try:
+            with span("question", source="user"):
+                with span("agent.run", agent=agent.name) as run_span:
+                    async with agent.run_stream(user_prompt=prompt) as result:
+                        async for delta in result.stream_text(delta=True):
+                            if "ttft" not in run_info:
+                                run_info["ttft"] = time.perf_counter() - started
+                                run_span.set(ttft=run_info["ttft"])
+                            deltas.put(delta)
+                        messages = result.new_messages()
+                    record_run_usage(agent.name, result)
+
+                log_interaction_to_file(
+                    agent,
+                    messages,
+                    cache_hit=getattr(result, "cache_hit", False)
+                )
+        except Exception as e:
+            run_info["error"] = e
+        finally:
+            # Always, so the consumer below can't block forever
+            deltas.put(done)
+
+    future = asyncio.run_coroutine_threadsafe(produce(), loop)
+    try:
+        while (delta := deltas.get()) is not done:
+            yield delta
+    finally:
+        future.cancel()
+
+    if "error" in run_info:
+        raise run_info["error"]
 
 # -------------------------------------------------
 # Chat input
@@ -85,15 +132,9 @@ if prompt := st.chat_input("Ask your question..."):
 
     # Assistant message
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            result = run_agent(prompt)
-            response_text = result.output
-            st.markdown(response_text)
-
-            log_interaction_to_file(
-                agent, result.new_messages()
-            )
+        run_info = {}
+        response_text = st.write_stream(stream_agent(prompt, run_info))
 
     st.session_state.messages.append(
         {"role": "assistant", "content": response_text}
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,732 @@
+# benchmark.py
+"""
+Local performance benchmarks (no LLM calls).
+
+    uv run benchmark.py chunking --scale 20 --workers 2 4 8
+    uv run benchmark.py ann --scale 50 --probes 1 4 8 16
+    uv run benchmark.py quant --scale 10 --rerank 0 50
+    uv run benchmark.py batching --clients 1 8 32 --batch-sizes 1 16 32
+    uv run benchmark.py embedders all-mpnet-base-v2@torch all-mpnet-base-v2@onnx-int8 all-MiniLM-L6-v2
+    uv run benchmark.py scheduler --rpm 60 --concurrency 1 4 16
+    uv run benchmark.py retrieval --scales 1 10 100 --compare benchmark_results/retrieval-abc1234.json
+"""
+import re
+import json
+import hashlib
+import time
+import random
+import asyncio
+import argparse
+import threading
+import subprocess
+from pathlib import Path
+from datetime import datetime
+from collections import deque
+from types import SimpleNamespace
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+
+from ingest import load_raw_documents
+from chunking import chunk_documents, count_tokens
+from vector_index import ExactVectorIndex, IVFVectorIndex
+from embeddings import QueryBatcher, embed_texts, load_embedding_model
+from scheduler import LLMScheduler
+from snippets import SEARCH_TOKEN_BUDGET
+
+# (question, expected file / section) pairs for the retrieval benchmark
+RETRIEVAL_QUESTIONS = Path("retrieval_questions.json")
+BENCHMARK_RESULTS_DIR = Path("benchmark_results")
+HIT_KS = (1, 3, 5, 10)
+
+_COPY_PREFIX = re.compile(r"^copy\d+/")
+# Chunks sampled for generated questions must have something to ask about
+RETRIEVAL_MIN_SECTION_TOKENS = 40
+RETRIEVAL_QUESTION_BATCH = 10
+
+
+def load_benchmark_docs(scale: int = 1) -> List[Dict[str, Any]]:
+    """
+    Project docs, replicated scale times under distinct filenames
+    to stand in for a larger multi-repo corpus.
+    """
+    docs = load_raw_documents()
+    return [
+        {**doc, "filename": f"copy{i}/{doc['filename']}"}
+        for i in range(scale)
+        for doc in docs
+    ]
+
+
+def best_time(fn, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_chunking(args) -> None:
+    docs = load_benchmark_docs(args.scale)
+    print(f"Chunking {len(docs)} docs (scale={args.scale})")
+
+    expected = chunk_documents(docs, num_workers=0)
+    serial = best_time(lambda: chunk_documents(docs, num_workers=0), args.repeats)
+    print(f"serial:    {serial:.3f}s  ({len(expected)} chunks)")
+
+    for workers in args.workers:
+        result = chunk_documents(docs, num_workers=workers)
+        assert result == expected, "parallel chunking differs from serial"
+        elapsed = best_time(
+            lambda: chunk_documents(docs, num_workers=workers), args.repeats
+        )
+        print(
+            f"workers={workers}: {elapsed:.3f}s  "
+            f"(speed-up x{serial / elapsed:.2f})"
+        )
+
+
+def load_benchmark_vectors(scale: int = 1, num_queries: int = 200, seed: int = 0):
+    """
+    Embeddings of the project's own chunks, plus query vectors from
+    chunk titles. For scale > 1 the corpus is grown with noisy copies
+    of the real vectors, so it keeps the real cluster structure.
+    """
+    from pipeline import load_indexes
+
+    indexes = load_indexes()
+    vectors = np.asarray(indexes.vector_index.vectors, dtype=np.float32)
+
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(indexes.chunks), min(num_queries, len(indexes.chunks)), replace=False)
+    queries = indexes.embedding_model.encode(
+        [indexes.chunks[i]["title"] for i in sample]
+    ).astype(np.float32)
+
+    if scale > 1:
+        copies = [vectors]
+        for _ in range(scale - 1):
+            noisy = vectors + rng.normal(scale=0.02, size=vectors.shape).astype(np.float32)
+            copies.append(noisy / np.linalg.norm(noisy, axis=1, keepdims=True))
+        vectors = np.vstack(copies)
+
+    return vectors, queries
+
+
+def search_ids(index, queries: np.ndarray, k: int):
+    started = time.perf_counter()
+    ids = [
+        [r["_id"] for r in index.search(q, num_results=k, output_ids=True)]
+        for q in queries
+    ]
+    latency_ms = (time.perf_counter() - started) / len(queries) * 1000
+    return ids, latency_ms
+
+
+def recall_at_k(expected, found) -> float:
+    return float(np.mean([
+        len(set(e) & set(f)) / max(len(e), 1) for e, f in zip(expected, found)
+    ]))
+
+
+def bench_ann(args) -> None:
+    vectors, queries = load_benchmark_vectors(args.scale, args.queries)
+    docs = [{} for _ in range(len(vectors))]
+    print(f"{len(vectors)} vectors, {len(queries)} queries, k={args.k}")
+
+    exact = ExactVectorIndex().fit(vectors, docs)
+    expected, exact_ms = search_ids(exact, queries, args.k)
+    print(f"exact:          {exact_ms:.2f} ms/query")
+
+    started = time.perf_counter()
+    ivf = IVFVectorIndex().fit(vectors, docs)
+    print(f"ivf build:      {time.perf_counter() - started:.2f}s ({len(ivf.centroids)} lists)")
+
+    for n_probe in args.probes:
+        ivf.n_probe = n_probe
+        found, ivf_ms = search_ids(ivf, queries, args.k)
+        print(
+            f"ivf n_probe={n_probe:<3} {ivf_ms:.2f} ms/query  "
+            f"recall@{args.k}={recall_at_k(expected, found):.3f}"
+        )
+
+
+def bench_quant(args) -> None:
+    vectors, queries = load_benchmark_vectors(args.scale, args.queries)
+    docs = [{} for _ in range(len(vectors))]
+    print(f"{len(vectors)} vectors, {len(queries)} queries, k={args.k}")
+
+    exact = ExactVectorIndex(dtype="float32").fit(vectors, docs)
+    expected, exact_ms = search_ids(exact, queries, args.k)
+    print(f"float32:            {exact_ms:.2f} ms/query  {exact.nbytes / 2**20:.1f} MB")
+
+    for dtype in ("float16", "int8"):
+        for rerank in args.rerank:
+            index = ExactVectorIndex(dtype=dtype, rerank=rerank).fit(vectors, docs)
+            found, ms = search_ids(index, queries, args.k)
+            print(
+                f"{dtype:<8} rerank={rerank:<4} {ms:.2f} ms/query  "
+                f"{index.nbytes / 2**20:.1f} MB  "
+                f"recall@{args.k}={recall_at_k(expected, found):.3f}"
+            )
+
+
+def run_load(encode, queries: List[str], clients: int):
+    """
+    clients threads issue the queries back to back (round robin split);
+    returns per-query latencies in seconds and the wall time.
+    """
+    latencies = [[] for _ in range(clients)]
+
+    def client(i):
+        for query in queries[i::clients]:
+            started = time.perf_counter()
+            encode(query)
+            latencies[i].append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    return np.array([l for ls in latencies for l in ls]), wall
+
+
+def bench_batching(args) -> None:
+    from sentence_transformers import SentenceTransformer
+    from indexes import EMBEDDING_MODEL_NAME
+
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+    chunks = chunk_documents(load_raw_documents())
+    # Distinct strings, so nothing is served from a cache
+    queries = [
+        f"how do I {chunks[i % len(chunks)]['title']} ({i})"
+        for i in range(args.queries)
+    ]
+    model.encode(queries[:8])  # warm-up
+
+    print(f"{len(queries)} queries, max_wait={args.max_wait_ms}ms")
+    for clients in args.clients:
+        for batch_size in args.batch_sizes:
+            if batch_size > 1:
+                batcher = QueryBatcher(model.encode, batch_size, args.max_wait_ms)
+                encode = batcher.encode
+            else:
+                batcher = None
+                encode = model.encode
+
+            latencies, wall = run_load(encode, queries, clients)
+            p50, p95 = np.percentile(latencies, [50, 95]) * 1000
+            mean_batch = batcher.stats()["mean_batch_size"] if batcher else 1.0
+            print(
+                f"clients={clients:<3} max_batch={batch_size:<3} "
+                f"p50={p50:7.1f}ms  p95={p95:7.1f}ms  "
+                f"{len(queries) / wall:7.1f} QPS  mean batch={mean_batch:.1f}"
+            )
+
+
+def bench_embedders(args) -> None:
+    from indexes import RepoIndexes
+
+    chunks = chunk_documents(load_benchmark_docs(args.scale))
+    texts = [RepoIndexes._build_text(chunk) for chunk in chunks]
+    docs = [{} for _ in chunks]
+
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(chunks), min(args.queries, len(chunks)), replace=False)
+    queries = [chunks[i]["title"] for i in sample]
+    print(f"{len(texts)} chunks, {len(queries)} queries, k={args.k}")
+
+    reference = None
+    for spec in args.embedders:
+        model_name, _, backend = spec.partition("@")
+        backend = backend or "torch"
+
+        started = time.perf_counter()
+        model = load_embedding_model(model_name, backend)
+        load_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        vectors = embed_texts(model, texts)
+        build_s = time.perf_counter() - started
+
+        latencies = []
+        query_vectors = []
+        for query in queries:
+            started = time.perf_counter()
+            query_vectors.append(model.encode(query))
+            latencies.append(time.perf_counter() - started)
+
+        index = ExactVectorIndex().fit(vectors, docs)
+        found, _ = search_ids(index, np.asarray(query_vectors, dtype=np.float32), args.k)
+
+        # hit@k: the chunk a query title came from is retrieved;
+        # overlap@k: agreement with the first embedder's top k
+        hit = np.mean([i in ids for i, ids in zip(sample, found)])
+        if reference is None:
+            reference = found
+        overlap = recall_at_k(reference, found)
+
+        print(
+            f"{model_name}@{backend}: load {load_s:.1f}s  "
+            f"build {build_s:.1f}s ({len(texts) / build_s:.0f} chunks/s)  "
+            f"query p50={np.percentile(latencies, 50) * 1000:.1f}ms  "
+            f"hit@{args.k}={hit:.3f}  overlap@{args.k}={overlap:.3f}"
+        )
+
+
+def base_filename(filename: str) -> str:
+    # copyN/path.md of a scaled corpus -> path.md
+    return _COPY_PREFIX.sub("", filename)
+
+
+def make_retrieval_questions(
+    chunks: List[Dict[str, Any]],
+    num_questions: int,
+    seed: int = 0,
+    batch_size: int = RETRIEVAL_QUESTION_BATCH,
+) -> List[Dict[str, Any]]:
+    """
+    Paraphrased questions for sampled chunks, written by an LLM (see
+    question_generation.py), with the chunk's filename and heading path
+    as the expected answer. Run once and commit the file, so every
+    benchmark run scores the same questions.
+    """
+    # Imported here: only --regenerate needs pydantic_ai and GEMINI_API_KEY
+    from question_generation import get_retrieval_question_generator
+
+    candidates = [c for c in chunks if count_tokens(c["section"]) >= RETRIEVAL_MIN_SECTION_TOKENS]
+    sample = random.Random(seed).sample(candidates, min(num_questions, len(candidates)))
+    scheduler = LLMScheduler()
+    retrieval_question_generator = get_retrieval_question_generator()
+
+    async def generate(batch):
+        prompt = json.dumps([{"title": c["title"], "text": c["section"]} for c in batch])
+        result = await scheduler.call(lambda: retrieval_question_generator.run(prompt))
+        questions = result.output.questions
+        if len(questions) != len(batch):
+            raise ValueError(f"expected {len(batch)} questions, got {len(questions)}")
+        return questions
+
+    async def generate_all():
+        batches = [sample[i:i + batch_size] for i in range(0, len(sample), batch_size)]
+        return await asyncio.gather(*(generate(batch) for batch in batches))
+
+    questions = [q for batch in asyncio.run(generate_all()) for q in batch]
+    return [
+        {
+            "question": question,
+            "filename": base_filename(chunk["filename"]),
+            "heading_path": chunk["heading_path"],
+        }
+        for question, chunk in zip(questions, sample)
+    ]
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def first_sentence(section: str, min_words: int = 5, max_words: int = 25) -> Optional[str]:
+    """
+    First prose sentence of a chunk, skipping headings, code, lists,
+    tables and quotes; None if no sentence has a usable length.
+    """
+    in_code = False
+    for line in section.splitlines():
+        line = line.strip()
+        if line.startswith("```"):
+            in_code = not in_code
+            continue
+        if in_code or not line or line[0] in "#-*|>![<" or line[0].isdigit():
+            continue
+        for sentence in _SENTENCE_END.split(line):
+            if min_words <= len(sentence.split()) <= max_words:
+                return sentence
+    return None
+
+
+def make_extractive_questions(chunks: List[Dict[str, Any]], num_questions: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Deterministic question set without an LLM: the first prose sentence
+    of sampled chunks. The text is copied from the section, so scores
+    run higher than on paraphrased questions (most of all for keyword
+    search); only compare runs on the same set.
+    """
+    candidates = []
+    for chunk in chunks:
+        sentence = first_sentence(chunk["section"])
+        if sentence is not None:
+            candidates.append({
+                "question": sentence,
+                "filename": base_filename(chunk["filename"]),
+                "heading_path": chunk["heading_path"],
+            })
+
+    rng = random.Random(seed)
+    return rng.sample(candidates, min(num_questions, len(candidates)))
+
+
+def load_retrieval_questions(args, base_chunks: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    The committed question set and where it came from; without one
+    (and without --regenerate) an extractive set built from the docs.
+    """
+    path = Path(args.questions_file)
+    if path.exists() and not args.regenerate:
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f), str(path)
+
+    if not args.regenerate:
+        print(
+            f"{path} not found, using extractive questions (first sentence of "
+            "sampled sections; scores run high). Write a paraphrased set with "
+            "--regenerate (needs GEMINI_API_KEY) and commit it"
+        )
+        return make_extractive_questions(base_chunks, args.questions), "extractive"
+
+    questions = make_retrieval_questions(base_chunks, args.questions)
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(questions, f, indent=2)
+    print(f"Wrote {len(questions)} questions to {path}; commit it to keep runs comparable")
+    return questions, str(path)
+
+
+def questions_digest(questions: List[Dict[str, Any]]) -> str:
+    data = json.dumps(questions, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(seconds, [50, 95, 99]) * 1000
+    return {"p50": round(p50, 3), "p95": round(p95, 3), "p99": round(p99, 3), "n": len(seconds)}
+
+
+def timed(samples: List[float], fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    samples.append(time.perf_counter() - started)
+    return result
+
+
+def first_match(question: Dict[str, Any], results: List[Dict[str, Any]], section_level: bool) -> Optional[int]:
+    for rank, r in enumerate(results, start=1):
+        if base_filename(r["filename"]) != question["filename"]:
+            continue
+        if not section_level or r["heading_path"] == question["heading_path"]:
+            return rank
+    return None
+
+
+def retrieval_quality(questions, results, section_level: bool) -> Dict[str, float]:
+    ranks = [first_match(q, r, section_level) for q, r in zip(questions, results)]
+    quality = {
+        f"hit@{k}": round(float(np.mean([rank is not None and rank <= k for rank in ranks])), 4)
+        for k in HIT_KS
+    }
+    quality["mrr"] = round(float(np.mean([1 / rank if rank else 0.0 for rank in ranks])), 4)
+    return quality
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_retrieval_scale(args, scale: int, model, base_vectors, questions, embed_samples) -> Dict[str, Any]:
+    from indexes import RepoIndexes
+    from pipeline import DOC_BATCH_SIZE
+    from snippets import shape_results
+    from tools import SearchTools, SEARCH_NUM_RESULTS
+
+    docs = load_benchmark_docs(scale)
+    chunk_samples = []
+    chunks = []
+    for i in range(0, len(docs), DOC_BATCH_SIZE):
+        chunks.extend(timed(chunk_samples, chunk_documents, docs[i:i + DOC_BATCH_SIZE]))
+
+    # Copies have the base corpus' text, so their vectors are noisy
+    # copies of the real ones instead of a scale-times longer embed
+    rng = np.random.default_rng(0)
+    copies = [base_vectors]
+    for _ in range(scale - 1):
+        noisy = base_vectors + rng.normal(scale=0.02, size=base_vectors.shape).astype(np.float32)
+        copies.append(noisy / np.linalg.norm(noisy, axis=1, keepdims=True))
+    vectors = np.vstack(copies)
+    assert len(vectors) == len(chunks), "scaled corpus does not chunk like the base one"
+
+    fit_samples = []
+    for _ in range(args.fit_repeats):
+        indexes = timed(fit_samples, RepoIndexes.from_embeddings, chunks, vectors, model)
+
+    max_k = max(HIT_KS)
+    tools = SearchTools(
+        indexes,
+        num_results=max_k,
+        num_candidates=max(args.candidates, max_k),
+        query_cache_size=0,
+        result_cache_size=0,
+        query_batch_size=1,
+    )
+
+    stages = {name: [] for name in ("query_encode", "text_search", "vector_search", "merge", "shape", "query_total")}
+    # Tool payload the agent gets (top SEARCH_NUM_RESULTS), whole
+    # sections vs token-budgeted snippets
+    payload_tokens = {"full": [], "shaped": []}
+    tools.hybrid_search(questions[0]["question"])  # warm-up
+    results = []
+    for q in questions:
+        started = time.perf_counter()
+        text_results = timed(stages["text_search"], tools._text_search, q["question"])
+        query_vec = timed(stages["query_encode"], tools._encode_query, q["question"])
+        vector_results = timed(stages["vector_search"], tools._vector_search, query_vec)
+        results.append(timed(stages["merge"], tools._merge, text_results, vector_results))
+        top = results[-1][:SEARCH_NUM_RESULTS]
+        shaped = timed(stages["shape"], shape_results, q["question"], top, args.token_budget)
+        stages["query_total"].append(time.perf_counter() - started)
+        payload_tokens["full"].append(count_tokens(json.dumps(top)))
+        payload_tokens["shaped"].append(count_tokens(json.dumps(shaped)))
+
+    latency = {
+        "chunk_batch": latency_summary(chunk_samples),
+        "embed_batch": latency_summary(embed_samples),
+        "index_fit": latency_summary(fit_samples),
+        **{name: latency_summary(samples) for name, samples in stages.items()},
+    }
+    return {
+        "num_docs": len(docs),
+        "num_chunks": len(chunks),
+        "vector_index": type(indexes.vector_index).__name__,
+        "payload_tokens": {name: round(float(np.mean(tokens)), 1) for name, tokens in payload_tokens.items()},
+        "quality": {
+            "section": retrieval_quality(questions, results, section_level=True),
+            "file": retrieval_quality(questions, results, section_level=False),
+        },
+        "latency_ms": latency,
+    }
+
+
+def print_retrieval_scale(scale: int, result: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> None:
+    def delta(value, old):
+        return f" ({value - old:+.3f})" if old is not None else ""
+
+    print(f"scale={scale}: {result['num_chunks']} chunks, {result['vector_index']}")
+    payload = result["payload_tokens"]
+    print(f"  payload  {payload['full']:.0f} tokens/search with whole sections, {payload['shaped']:.0f} as snippets")
+    for level, quality in result["quality"].items():
+        old = previous["quality"][level] if previous else {}
+        print(f"  {level:<8} " + "  ".join(
+            f"{name}={value:.3f}{delta(value, old.get(name))}" for name, value in quality.items()
+        ))
+    for stage, summary in result["latency_ms"].items():
+        old = previous["latency_ms"].get(stage, {}) if previous else {}
+        print(f"  {stage:<14} " + "  ".join(
+            f"{p}={summary[p]:8.2f}ms{delta(summary[p], old.get(p))}" for p in ("p50", "p95", "p99")
+        ))
+
+
+def bench_retrieval(args) -> None:
+    from indexes import RepoIndexes, EMBEDDING_MODEL_NAME, EMBED_BATCH_SIZE
+    from embeddings import EMBEDDING_BACKEND
+    from vector_index import VECTOR_BACKEND, VECTOR_DTYPE
+
+    base_chunks = chunk_documents(load_raw_documents())
+    questions, questions_source = load_retrieval_questions(args, base_chunks)
+    print(f"{len(questions)} questions, {len(base_chunks)} base chunks")
+
+    model = load_embedding_model(EMBEDDING_MODEL_NAME, EMBEDDING_BACKEND)
+    texts = [RepoIndexes._build_text(chunk) for chunk in base_chunks]
+    model.encode(texts[:EMBED_BATCH_SIZE])  # warm-up
+    embed_samples = []
+    base_vectors = np.vstack([
+        timed(embed_samples, model.encode, texts[i:i + EMBED_BATCH_SIZE])
+        for i in range(0, len(texts), EMBED_BATCH_SIZE)
+    ]).astype(np.float32)
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        print(f"Comparing with {args.compare} (commit {previous.get('commit')})")
+
+    report = {
+        "commit": git_commit(),
+        "created": datetime.now().isoformat(),
+        "config": {
+            "model": EMBEDDING_MODEL_NAME,
+            "embedding_backend": EMBEDDING_BACKEND,
+            "vector_backend": VECTOR_BACKEND,
+            "vector_dtype": VECTOR_DTYPE,
+            "num_candidates": max(args.candidates, max(HIT_KS)),
+            "token_budget": args.token_budget,
+            "questions_source": questions_source,
+            "questions_sha256": questions_digest(questions),
+            "num_questions": len(questions),
+        },
+        "scales": {},
+    }
+
+    if previous and previous.get("config", {}).get("questions_sha256") != report["config"]["questions_sha256"]:
+        print("Warning: the question set differs from the compared run; quality deltas are not comparable")
+
+    for scale in args.scales:
+        result = run_retrieval_scale(args, scale, model, base_vectors, questions, embed_samples)
+        report["scales"][str(scale)] = result
+        print_retrieval_scale(scale, result, previous.get("scales", {}).get(str(scale)))
+
+    output = Path(args.output or BENCHMARK_RESULTS_DIR / f"retrieval-{report['commit']}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with output.open("w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+
+class FakeRateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"429 Too Many Requests, retry after {retry_after:.2f}s")
+        self.retry_after = retry_after
+
+
+class FakeLLM:
+    """
+    Local stand-in for a rate-limited LLM API: rpm requests and tpm
+    tokens per sliding window of `window` seconds, else a 429 with a
+    retry-after hint. Each call takes `latency` seconds.
+    """
+
+    def __init__(self, rpm: int, tpm: int, window: float, latency: float):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self.latency = latency
+        self.calls = deque()
+        self.rejected = 0
+
+    async def __call__(self, tokens: int):
+        now = time.monotonic()
+        while self.calls and self.calls[0][0] <= now - self.window:
+            self.calls.popleft()
+
+        used = sum(t for _, t in self.calls)
+        if len(self.calls) >= self.rpm or used + tokens > self.tpm:
+            self.rejected += 1
+            raise FakeRateLimitError(self.calls[0][0] + self.window - now)
+
+        self.calls.append((now, tokens))
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(usage=lambda: SimpleNamespace(requests=1, total_tokens=tokens))
+
+
+async def run_fake_calls(args, concurrency: int):
+    llm = FakeLLM(args.rpm, args.tpm, args.window, args.latency)
+    scheduler = LLMScheduler(
+        rpm=args.rpm,
+        tpm=args.tpm,
+        max_concurrency=concurrency,
+        max_retries=20,
+        backoff_base=1.5,
+        backoff_max=args.window,
+        period=args.window,
+    )
+
+    rng = random.Random(0)
+    costs = [rng.randint(500, 3000) for _ in range(args.calls)]
+
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        scheduler.call(lambda t=t: llm(t), tokens=2000) for t in costs
+    ))
+    return time.perf_counter() - started, llm.rejected, scheduler.stats()
+
+
+def bench_scheduler(args) -> None:
+    print(
+        f"{args.calls} calls of {args.latency}s against a fake API allowing "
+        f"{args.rpm} requests / {args.tpm} tokens per {args.window}s"
+    )
+    # One call at a time, starts at least window / rpm apart
+    serial = args.calls * max(args.window / args.rpm, args.latency)
+    print(f"fixed interval (old llm_call): ~{serial:.1f}s")
+
+    for concurrency in args.concurrency:
+        wall, rejected, stats = asyncio.run(run_fake_calls(args, concurrency))
+        print(
+            f"concurrency={concurrency:<3} {wall:6.1f}s  "
+            f"{args.calls / wall:5.1f} calls/s  429s={rejected}  retries={stats['retries']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    sub = parser.add_subparsers(dest="benchmark", required=True)
+
+    p = sub.add_parser("chunking", help="serial vs process-pool chunking")
+    p.add_argument("--scale", type=int, default=20)
+    p.add_argument("--workers", type=int, nargs="+", default=[2, 4])
+    p.add_argument("--repeats", type=int, default=3)
+    p.set_defaults(fn=bench_chunking)
+
+    p = sub.add_parser("ann", help="exact vs IVF vector search, recall vs latency")
+    p.add_argument("--scale", type=int, default=1)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--k", type=int, default=10)
+    p.add_argument("--probes", type=int, nargs="+", default=[1, 4, 8, 16])
+    p.set_defaults(fn=bench_ann)
+
+    p = sub.add_parser("quant", help="float16 / int8 vector storage vs float32")
+    p.add_argument("--scale", type=int, default=1)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--k", type=int, default=10)
+    p.add_argument("--rerank", type=int, nargs="+", default=[0, 50])
+    p.set_defaults(fn=bench_quant)
+
+    p = sub.add_parser("batching", help="query micro-batching under concurrent load")
+    p.add_argument("--queries", type=int, default=512)
+    p.add_argument("--clients", type=int, nargs="+", default=[1, 8, 32])
+    p.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32])
+    p.add_argument("--max-wait-ms", type=float, default=2)
+    p.set_defaults(fn=bench_batching)
+
+    p = sub.add_parser("embedders", help="embedding model / backend build time, latency, recall")
+    p.add_argument("embedders", nargs="+", help="model[@backend], first one is the reference")
+    p.add_argument("--scale", type=int, default=1)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--k", type=int, default=10)
+    p.set_defaults(fn=bench_embedders)
+
+    p = sub.add_parser("scheduler", help="LLM scheduler against a fake rate-limited API")
+    p.add_argument("--calls", type=int, default=60)
+    p.add_argument("--rpm", type=int, default=20)
+    p.add_argument("--tpm", type=int, default=40000)
+    p.add_argument("--window", type=float, default=2.0, help="seconds standing in for a minute")
+    p.add_argument("--latency", type=float, default=0.3)
+    p.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    p.set_defaults(fn=bench_scheduler)
+
+    p = sub.add_parser("retrieval", help="hit@k, MRR and per-stage latency of hybrid search")
+    p.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    p.add_argument("--questions-file", default=RETRIEVAL_QUESTIONS)
+    p.add_argument("--questions", type=int, default=100, help="size of a generated question set")
+    p.add_argument("--regenerate", action="store_true", help="write a new question set with the LLM")
+    p.add_argument("--candidates", type=int, default=10, help="candidates per search side")
+    p.add_argument("--fit-repeats", type=int, default=3)
+    p.add_argument("--token-budget", type=int, default=SEARCH_TOKEN_BUDGET, help="snippet tokens per search")
+    p.add_argument("--output", help="default: benchmark_results/retrieval-<commit>.json")
+    p.add_argument("--compare", help="earlier results JSON to print deltas against")
+    p.set_defaults(fn=bench_retrieval)
+
+    args = parser.parse_args()
+    args.fn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,32 @@
 # chunking.py
+import os
 import re
-from typing import List, Dict, Any
+from pathlib import PurePosixPath
+from functools import lru_cache, partial
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+
+from metrics import traced
+
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", 0))
+CHUNK_BATCH_SIZE = 64
+
+# all-mpnet-base-v2 truncates at 384 word pieces; count_tokens is a
+# word-level estimate, so leave headroom for title + filename too
+MAX_CHUNK_TOKENS = int(os.getenv("MAX_CHUNK_TOKENS", 300))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 0))
+
+# Deepest header level split on before falling back to paragraphs
+MAX_SPLIT_LEVEL = 3
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+@lru_cache(maxsize=None)
+def _header_pattern(level: int) -> re.Pattern:
+    # This regex matches markdown headers
+    # For level 2, it matches lines starting with "## "
+    return re.compile(r'^(#{' + str(level) + r'} )(.+)$', re.MULTILINE)
 
 
 def split_markdown_by_level(text: str, level: int = 2) -> List[str]:
@@ -12,12 +38,7 @@ def split_markdown_by_level(text: str, level: int = 2) -> List[str]:
     :return: List of sections as strings
     """
 
-    # This regex matches markdown headers
-    # For level 2, it matches lines starting with "## "
-    header_pattern = r'^(#{' + str(level) + r'} )(.+)$'
-    pattern = re.compile(header_pattern, re.MULTILINE)
-    
-    parts = pattern.split(text)
+    parts = _header_pattern(level).split(text)
 
     sections = []
     for i in range(1, len(parts), 3):
@@ -54,23 +75,243 @@ def detect_content_type(filename: str) -> str:
     """
     return "assignment" if "assignment" in filename.lower() else "learning"
 
-def chunk_documents(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def count_tokens(text: str) -> int:
     """
-    End-to-end chunking:
-    - split into sections
-    - return chunked documents
+    Cheap token estimate: words and punctuation marks.
+    """
+    return len(_TOKEN_RE.findall(text))
+
+
+def _split_by_header(text: str, level: int) -> Tuple[str, List[Tuple[str, str]]]:
+    """
+    Returns (text before the first header, [(header, body), ...]).
+    """
+    parts = _header_pattern(level).split(text)
+    preamble = parts[0].strip()
+    sections = []
+    for i in range(1, len(parts), 3):
+        header = (parts[i] + parts[i+1]).strip()
+        body = parts[i+2].strip() if i+2 < len(parts) else ""
+        sections.append((header, body))
+    return preamble, sections
+
+
+def _overlap_tail(text: str, overlap: int) -> str:
+    """
+    The last words of text, up to overlap tokens.
+    """
+    words = text.split()
+    start = len(words)
+    while start > 0 and count_tokens(" ".join(words[start - 1:])) <= overlap:
+        start -= 1
+    return " ".join(words[start:])
+
+
+def _pack_paragraphs(text: str, max_tokens: int, overlap: int) -> List[str]:
+    """
+    Greedily packs paragraphs (then words, for oversized paragraphs)
+    into pieces of at most max_tokens, each starting with the last
+    overlap tokens of the previous piece.
+    """
+    overlap = min(overlap, max_tokens // 2)
+    unit_budget = max_tokens - overlap
+
+    units = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= unit_budget:
+            units.append(paragraph)
+            continue
+        words = paragraph.split()
+        start = 0
+        while start < len(words):
+            end = min(start + unit_budget, len(words))
+            # Punctuation counts as tokens too, so shrink until it fits
+            while end > start + 1 and count_tokens(" ".join(words[start:end])) > unit_budget:
+                end = start + max(1, (end - start) * 9 // 10)
+            units.append(" ".join(words[start:end]))
+            start = end
+
+    pieces = []
+    current = []
+    current_tokens = 0
+    for unit in units:
+        unit_tokens = count_tokens(unit)
+        if current and current_tokens + unit_tokens > max_tokens:
+            pieces.append("\n\n".join(current))
+            tail = _overlap_tail(pieces[-1], overlap) if overlap else ""
+            current = [tail] if tail else []
+            current_tokens = count_tokens(tail)
+        current.append(unit)
+        current_tokens += unit_tokens
+    if current:
+        pieces.append("\n\n".join(current))
+
+    return pieces
+
+
+def _split_to_budget(
+    text: str,
+    heading_path: List[str],
+    level: int,
+    max_tokens: Optional[int],
+    overlap: int,
+) -> List[Tuple[List[str], str]]:
+    """
+    Recursively splits text by H<level>, H<level+1>, ... and finally by
+    paragraphs until every piece fits max_tokens.
     """
+    if max_tokens is None or count_tokens(text) <= max_tokens:
+        return [(heading_path, text)]
+
+    if level > MAX_SPLIT_LEVEL:
+        return [
+            (heading_path, piece)
+            for piece in _pack_paragraphs(text, max_tokens, overlap)
+        ]
+
+    preamble, sections = _split_by_header(text, level)
+    if not sections:
+        return _split_to_budget(text, heading_path, level + 1, max_tokens, overlap)
+
+    pieces = []
+    if preamble:
+        pieces.extend(
+            _split_to_budget(preamble, heading_path, level + 1, max_tokens, overlap)
+        )
+    for header, body in sections:
+        section = f"{header}\n\n{body}" if body else header
+        pieces.extend(_split_to_budget(
+            section,
+            heading_path + [extract_title(header)],
+            level + 1,
+            max_tokens,
+            overlap,
+        ))
+    return pieces
+
+
+def split_markdown_hierarchical(
+    text: str,
+    max_tokens: Optional[int] = MAX_CHUNK_TOKENS,
+    overlap: int = CHUNK_OVERLAP_TOKENS,
+) -> List[Tuple[List[str], str]]:
+    """
+    Splits markdown into (heading path, text) pieces:
+    - always on H2, like split_markdown_by_level
+    - text before the first H2 is kept as its own piece
+    - pieces over max_tokens are split further by H3, then paragraphs
+    """
+    preamble, sections = _split_by_header(text, 2)
+
+    root = []
+    first_line = preamble.splitlines()[0] if preamble else ""
+    if first_line.startswith("# "):
+        root = [extract_title(first_line)]
+
+    pieces = []
+    # A preamble that is only the H1 line carries no content of its own
+    if preamble and not (root and preamble == first_line):
+        pieces.extend(_split_to_budget(preamble, root, 3, max_tokens, overlap))
+    for header, body in sections:
+        section = f"{header}\n\n{body}" if body else header
+        pieces.extend(_split_to_budget(
+            section, root + [extract_title(header)], 3, max_tokens, overlap
+        ))
+    return pieces
+
+
+def _chunk_batch(
+    docs: List[Dict[str, Any]],
+    max_tokens: Optional[int] = MAX_CHUNK_TOKENS,
+    overlap: int = CHUNK_OVERLAP_TOKENS,
+) -> List[Dict[str, Any]]:
     chunks = []
 
     for doc in docs:
-        sections = split_markdown_by_level(doc["content"], level=2)
+        filename = doc["filename"]
+        content_type = detect_content_type(filename)
+        pieces = split_markdown_hierarchical(doc["content"], max_tokens, overlap)
 
-        for section in sections:
+        for heading_path, section in pieces:
+            title = heading_path[-1] if heading_path else PurePosixPath(filename).parent.name
             chunks.append({
-                "filename": doc["filename"],
-                "content_type": detect_content_type(doc["filename"]),
-                "title": extract_title(section),
+                "filename": filename,
+                "content_type": content_type,
+                "title": title,
+                "heading_path": heading_path,
                 "section": section
             })
 
     return chunks
+
+
+def _slim_docs(docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Only the fields chunking needs are sent to the workers
+    return [
+        {"filename": doc["filename"], "content": doc["content"]}
+        for doc in docs
+    ]
+
+
+def submit_chunk_batch(
+    pool: Executor,
+    docs: List[Dict[str, Any]],
+    max_tokens: Optional[int] = MAX_CHUNK_TOKENS,
+    overlap: int = CHUNK_OVERLAP_TOKENS,
+) -> Future:
+    """
+    Chunks one batch of documents on a pool the caller keeps open, so a
+    stream of batches shares one set of workers (see
+    pipeline.stream_chunk_batches).
+    """
+    return pool.submit(_chunk_batch, _slim_docs(docs), max_tokens, overlap)
+
+
+@traced("chunk_documents")
+def chunk_documents(
+    docs: List[Dict[str, Any]],
+    num_workers: int = CHUNK_WORKERS,
+    batch_size: int = CHUNK_BATCH_SIZE,
+    max_tokens: Optional[int] = MAX_CHUNK_TOKENS,
+    overlap: int = CHUNK_OVERLAP_TOKENS,
+) -> List[Dict[str, Any]]:
+    """
+    End-to-end chunking:
+    - split into sections (H2, then H3 / paragraphs for oversized ones)
+    - keep each chunk under max_tokens, with optional overlap
+    - return chunked documents with their heading path
+
+    With num_workers > 1, batches of documents are chunked in a process
+    pool; results are concatenated in input order, so the output is the
+    same as the serial path.
+    """
+    chunk_batch = partial(_chunk_batch, max_tokens=max_tokens, overlap=overlap)
+
+    if num_workers <= 1 or len(docs) <= batch_size:
+        return chunk_batch(docs)
+
+    slim_docs = _slim_docs(docs)
+    batches = [
+        slim_docs[i:i + batch_size]
+        for i in range(0, len(slim_docs), batch_size)
+    ]
+
+    chunks = []
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        for batch_chunks in pool.map(chunk_batch, batches):
+            chunks.extend(batch_chunks)
+
+    return chunks
+
+
+def chunking_config() -> Dict[str, Any]:
+    """
+    Settings that change chunk output; stored with index snapshots.
+    """
+    return {
+        "max_tokens": MAX_CHUNK_TOKENS,
+        "overlap": CHUNK_OVERLAP_TOKENS,
+    }
@@ -0,0 +1,274 @@
+# embedding_cache.py
+import os
+import json
+import time
+import hashlib
+import secrets
+import numpy as np
+from pathlib import Path
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+EMBEDDING_CACHE_DIR = Path(os.getenv("EMBEDDING_CACHE_DIR", ".cache/embeddings"))
+EMBEDDING_CACHE_MAX_MB = int(os.getenv("EMBEDDING_CACHE_MAX_MB", 512))
+
+INDEX_FILE = "keys.json"
+LOCK_FILE = ".lock"
+# Replaced vectors files are deleted only after this long, so a process
+# that has just read the old keys.json can still open its matrix
+VECTORS_GC_GRACE_SECONDS = 600
+
+
+def content_key(text: str, model_name: str) -> str:
+    """
+    Content address of an embedding: model name + exact input text.
+    """
+    h = hashlib.sha256()
+    h.update(model_name.encode("utf-8"))
+    h.update(b"\0")
+    h.update(text.encode("utf-8"))
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding store keyed by content hash.
+
+    - keys.json: small index {hash: [row, last_used]} + model/dim
+    - vectors-<id>.npy: float32 matrix, opened memory-mapped
+
+    Writes go to a new vectors file and keys.json is replaced last,
+    so readers never see an index pointing at the wrong matrix.
+    Writers (store / touch) hold a lock file and start from the
+    current keys.json, so concurrent processes never point it back at
+    a replaced matrix; replaced files are garbage collected later.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path = EMBEDDING_CACHE_DIR,
+        model_name: str = "all-mpnet-base-v2",
+        max_mb: int = EMBEDDING_CACHE_MAX_MB,
+    ):
+        self.cache_dir = Path(cache_dir) / model_name.replace("/", "__")
+        self.model_name = model_name
+        self.max_bytes = max_mb * 1024 * 1024
+
+        self.dim: Optional[int] = None
+        self.entries = {}
+        self.generation = 0
+        self.vectors_file: Optional[str] = None
+        self.vectors: Optional[np.ndarray] = None
+
+        self.hits = 0
+        self.misses = 0
+        self._pending_texts: List[str] = []
+        self._pending_vectors: List[np.ndarray] = []
+
+        self._read_index()
+
+    @contextmanager
+    def _locked(self):
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with (self.cache_dir / LOCK_FILE).open("a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load_index(self) -> Optional[dict]:
+        """
+        The current keys.json with its matrix mapped, or None if there
+        is no usable one (missing, other model, or its vectors file gone).
+        """
+        index_path = self.cache_dir / INDEX_FILE
+        if not index_path.exists():
+            return None
+
+        with index_path.open("r", encoding="utf-8") as f:
+            index = json.load(f)
+
+        if index.get("model") != self.model_name:
+            return None
+
+        try:
+            index["vectors"] = np.load(self.cache_dir / index["vectors_file"], mmap_mode="r")
+        except FileNotFoundError:
+            print(f"Embedding cache: {index['vectors_file']} is missing, starting empty")
+            return None
+        return index
+
+    def _read_index(self) -> None:
+        index = self._load_index()
+        if index is None:
+            return
+
+        self.dim = index["dim"]
+        self.entries = index["entries"]
+        self.generation = index["generation"] + 1
+        self.vectors_file = index["vectors_file"]
+        self.vectors = index["vectors"]
+
+    def _refresh(self) -> None:
+        # Adopt what other processes wrote since we read the index,
+        # keeping our newer last-used markers; called under the lock
+        index = self._load_index()
+        if index is None or index["vectors_file"] == self.vectors_file:
+            return
+
+        entries = index["entries"]
+        for key, entry in entries.items():
+            mine = self.entries.get(key)
+            if mine is not None:
+                entry[1] = max(entry[1], mine[1])
+
+        self.dim = index["dim"]
+        self.entries = entries
+        self.generation = max(self.generation, index["generation"] + 1)
+        self.vectors_file = index["vectors_file"]
+        self.vectors = index["vectors"]
+
+    def _collect_garbage(self) -> None:
+        # Vectors files no index points at any more, once past the grace period
+        cutoff = time.time() - VECTORS_GC_GRACE_SECONDS
+        for path in self.cache_dir.glob("vectors-*.npy"):
+            if path.name != self.vectors_file and path.stat().st_mtime < cutoff:
+                path.unlink(missing_ok=True)
+
+    def _write_index(self) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        index = {
+            "model": self.model_name,
+            "dim": self.dim,
+            "generation": self.generation,
+            "vectors_file": self.vectors_file,
+            "entries": self.entries,
+        }
+        tmp_path = self.cache_dir / f"{INDEX_FILE}.{secrets.token_hex(3)}.tmp"
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.cache_dir / INDEX_FILE)
+
+    def lookup(self, texts: List[str]) -> Tuple[Optional[np.ndarray], List[int]]:
+        """
+        Returns (matrix with cached rows filled in, indices still to embed).
+        The matrix is None when nothing is cached yet for this model.
+        """
+        if self.dim is None:
+            self.misses += len(texts)
+            return None, list(range(len(texts)))
+
+        embeddings = np.empty((len(texts), self.dim), dtype=np.float32)
+        missing = []
+        hit_rows = []
+        hit_positions = []
+
+        for i, text in enumerate(texts):
+            entry = self.entries.get(content_key(text, self.model_name))
+            if entry is None:
+                missing.append(i)
+                continue
+            entry[1] = self.generation
+            hit_rows.append(entry[0])
+            hit_positions.append(i)
+
+        if hit_rows:
+            embeddings[hit_positions] = self.vectors[hit_rows]
+
+        self.hits += len(hit_rows)
+        self.misses += len(missing)
+        return embeddings, missing
+
+    def add(self, texts: List[str], vectors: np.ndarray) -> None:
+        """
+        Queues new vectors; they are written in one go by flush().
+        """
+        self._pending_texts.extend(texts)
+        self._pending_vectors.append(vectors)
+
+    def flush(self) -> None:
+        """
+        Writes queued vectors (or just last-used markers if none).
+        """
+        print(f"Embedding cache: {self.hits} hits, {self.misses} misses")
+
+        if not self._pending_texts:
+            self.touch()
+            return
+
+        self.store(self._pending_texts, np.vstack(self._pending_vectors))
+        self._pending_texts = []
+        self._pending_vectors = []
+
+    def store(self, texts: List[str], new_vectors: np.ndarray) -> None:
+        """
+        Adds vectors for texts, evicting least recently used
+        entries when the store grows past the size limit.
+        """
+        with self._locked():
+            self._refresh()
+            self._store(texts, new_vectors)
+            self._collect_garbage()
+
+    def _store(self, texts: List[str], new_vectors: np.ndarray) -> None:
+        self.dim = new_vectors.shape[1]
+        row_bytes = self.dim * 4
+        max_rows = max(self.max_bytes // row_bytes, len(texts))
+
+        new_keys = {}
+        for i, text in enumerate(texts):
+            new_keys[content_key(text, self.model_name)] = i
+
+        # Keep the most recently used old entries that still fit
+        old = [
+            (key, entry) for key, entry in self.entries.items()
+            if key not in new_keys
+        ]
+        old.sort(key=lambda kv: kv[1][1], reverse=True)
+        old = old[:max_rows - len(new_keys)]
+
+        vectors_file = f"vectors-{secrets.token_hex(4)}.npy"
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        out = np.lib.format.open_memmap(
+            self.cache_dir / vectors_file,
+            mode="w+",
+            dtype=np.float32,
+            shape=(len(old) + len(new_keys), self.dim),
+        )
+
+        entries = {}
+        if old:
+            out[:len(old)] = self.vectors[[entry[0] for _, entry in old]]
+            for row, (key, entry) in enumerate(old):
+                entries[key] = [row, entry[1]]
+
+        for row, (key, i) in enumerate(new_keys.items(), start=len(old)):
+            out[row] = new_vectors[i]
+            entries[key] = [row, self.generation]
+
+        out.flush()
+        del out
+
+        self.entries = entries
+        self.vectors_file = vectors_file
+        self._write_index()
+        self.vectors = np.load(self.cache_dir / vectors_file, mmap_mode="r")
+
+    def touch(self) -> None:
+        """
+        Persists last-used markers after a lookup with no misses.
+        """
+        if self.dim is None:
+            return
+        with self._locked():
+            # Never write back a vectors file another process replaced
+            self._refresh()
+            self._write_index()
@@ -0,0 +1,252 @@
+# embeddings.py
+import os
+import time
+import queue
+import threading
+import numpy as np
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+from metrics import traced
+
+DEFAULT_BATCH_SIZE = 64
+
+# Inference backend for the sentence-transformers model:
+# torch, torch-int8, onnx or onnx-int8 (the onnx ones need optimum[onnxruntime])
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_INT8_FILE = "onnx/model_qint8_avx512_vnni.onnx"
+
+# Query micro-batching; QUERY_BATCH_MAX_SIZE=1 encodes each query on its own
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", 32))
+QUERY_BATCH_MAX_WAIT_MS = float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", 2))
+
+
+def _load_torch(model_name: str):
+    # sentence_transformers pulls in torch, so it is imported on first use
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(model_name)
+
+
+def _load_torch_int8(model_name: str):
+    # Dynamic int8 quantization of the Linear layers, CPU only
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    return torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+    )
+
+
+def _load_onnx(model_name: str, file_name: Optional[str] = None):
+    from sentence_transformers import SentenceTransformer
+
+    model_kwargs = {"file_name": file_name} if file_name else None
+    try:
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs=model_kwargs)
+    except ImportError as e:
+        raise ImportError(
+            "The onnx embedding backends need optimum[onnxruntime]: "
+            "pip install 'optimum[onnxruntime]'"
+        ) from e
+
+
+def _load_onnx_int8(model_name: str):
+    return _load_onnx(model_name, ONNX_INT8_FILE)
+
+
+EMBEDDING_BACKENDS = {
+    "torch": _load_torch,
+    "torch-int8": _load_torch_int8,
+    "onnx": _load_onnx,
+    "onnx-int8": _load_onnx_int8,
+}
+
+
+def load_embedding_model(model_name: str, backend: str = EMBEDDING_BACKEND):
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(
+            f"Unknown embedding backend {backend!r}, "
+            f"expected one of {sorted(EMBEDDING_BACKENDS)}"
+        )
+    return EMBEDDING_BACKENDS[backend](model_name)
+
+
+def embedder_id(model_name: str, backend: str = EMBEDDING_BACKEND) -> str:
+    """
+    Names the vector space a model + backend produce; embedding cache
+    keys use it, so vectors from different backends never mix.
+    """
+    # Plain torch keeps the bare model name (and existing caches)
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+@traced("embed_texts")
+def embed_texts(
+    model,
+    texts: List[str],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    num_workers: int = 0,
+    pool: Optional[Dict[str, Any]] = None,
+) -> np.ndarray:
+    """
+    Batched embedding stage:
+    - sorts texts by length so each batch pads to similar sizes
+    - sends batches to the model (optionally over a CPU process pool)
+    - writes rows into one preallocated float32 matrix, in input order
+
+    pool is a running start_multi_process_pool() to reuse across calls
+    (see EmbeddingPool); with num_workers > 1 and no pool, one is
+    started and stopped for this call.
+    """
+    dim = model.get_sentence_embedding_dimension()
+    embeddings = np.empty((len(texts), dim), dtype=np.float32)
+
+    if not texts:
+        return embeddings
+
+    # Longest first, so the slowest batches start early in the pool
+    order = np.argsort([-len(t) for t in texts], kind="stable")
+    sorted_texts = [texts[i] for i in order]
+
+    started = time.perf_counter()
+
+    if pool is not None or num_workers > 1:
+        own_pool = pool is None
+        if own_pool:
+            pool = model.start_multi_process_pool(["cpu"] * num_workers)
+        try:
+            embeddings[order] = model.encode(
+                sorted_texts,
+                batch_size=batch_size,
+                pool=pool,
+                chunk_size=batch_size * 4,
+            )
+        finally:
+            if own_pool:
+                model.stop_multi_process_pool(pool)
+    else:
+        for start in range(0, len(sorted_texts), batch_size):
+            rows = order[start:start + batch_size]
+            embeddings[rows] = model.encode(
+                sorted_texts[start:start + batch_size],
+                batch_size=batch_size,
+            )
+
+    elapsed = time.perf_counter() - started
+    print(
+        f"Embedded {len(texts)} chunks in {elapsed:.1f}s "
+        f"({len(texts) / max(elapsed, 1e-9):.1f} chunks/sec, "
+        f"batch_size={batch_size}, workers={num_workers})"
+    )
+
+    return embeddings
+
+
+class EmbeddingPool:
+    """
+    One CPU process pool for every embed_texts call of a build, so
+    workers (each with its own copy of the model) start once rather
+    than per batch. Started on first use: a fully cached build never
+    loads the model.
+    """
+
+    def __init__(self, get_model: Callable[[], Any], num_workers: int):
+        self.get_model = get_model
+        self.num_workers = num_workers
+        self._pool = None
+
+    def get(self) -> Optional[Dict[str, Any]]:
+        # None when encoding runs in-process
+        if self.num_workers <= 1:
+            return None
+        if self._pool is None:
+            self._pool = self.get_model().start_multi_process_pool(
+                ["cpu"] * self.num_workers
+            )
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self.get_model().stop_multi_process_pool(self._pool)
+            self._pool = None
+
+    def __enter__(self) -> "EmbeddingPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class QueryBatcher:
+    """
+    Dynamic micro-batching of query embeddings:
+    - callers submit one query each and block on their own future
+    - a worker thread takes the first waiting query, then gathers more
+      for up to max_wait_ms (or until max_batch_size)
+    - one encode_batch call per batch; duplicate texts are encoded once
+    """
+
+    def __init__(
+        self,
+        encode_batch: Callable[[List[str]], np.ndarray],
+        max_batch_size: int = QUERY_BATCH_MAX_SIZE,
+        max_wait_ms: float = QUERY_BATCH_MAX_WAIT_MS,
+    ):
+        self.encode_batch = encode_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.queries = 0
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(
+            target=self._run, name="query-batcher", daemon=True
+        )
+        self._worker.start()
+
+    def encode(self, text: str) -> np.ndarray:
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # Past the deadline, still take what is already queued
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            texts = list(dict.fromkeys(text for text, _ in batch))
+
+            try:
+                vectors = self.encode_batch(texts)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            rows = dict(zip(texts, vectors))
+            for text, future in batch:
+                future.set_result(rows[text])
+
+            self.batches += 1
+            self.queries += len(batch)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch_size": self.queries / max(self.batches, 1),
+        }
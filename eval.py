@@ -1,7 +1,10 @@
 import json
+from functools import lru_cache
 from pydantic_ai import Agent
 from pydantic_ai.models.gemini import GeminiModel
 from pydantic import BaseModel
+
+from metrics import span, record_run_usage
 # ---------- Evaluation prompt ----------
 
 EVALUATION_PROMPT = """
@@ -36,16 +39,19 @@ class EvaluationChecklist(BaseModel):
 
 # ---------- Eval agent ----------
 
-eval_model = GeminiModel(
-    model_name="gemini-2.5-flash-lite"
-)
+@lru_cache(maxsize=None)
+def get_eval_agent() -> Agent:
+    # Built on first use rather than at import
+    eval_model = GeminiModel(
+        model_name="gemini-2.5-flash-lite"
+    )
 
-eval_agent = Agent(
-    name="eval_agent",
-    model=eval_model,
-    instructions=EVALUATION_PROMPT,
-    output_type=EvaluationChecklist
-)
+    return Agent(
+        name="eval_agent",
+        model=eval_model,
+        instructions=EVALUATION_PROMPT,
+        output_type=EvaluationChecklist
+    )
 
 
 # ---------- Prompt format ----------
@@ -104,5 +110,7 @@ async def evaluate_log_record(eval_agent, log_record):
         log=json.dumps(log_simplified),
     )
 
-    result = await eval_agent.run(user_prompt)
+    with span("agent.run", agent=eval_agent.name):
+        result = await eval_agent.run(user_prompt)
+        record_run_usage(eval_agent.name, result)
     return result.output
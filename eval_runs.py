@@ -0,0 +1,127 @@
+# eval_runs.py
+import os
+import json
+import secrets
+from pathlib import Path
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+
+import pandas as pd
+
+EVAL_RUNS_DIR = Path(os.getenv("EVAL_RUNS_DIR", "eval_runs"))
+# Evaluated rows buffered before a Parquet part is written; a part per
+# row is cheap next to the LLM calls a lost row would cost again
+EVAL_FLUSH_ROWS = int(os.getenv("EVAL_FLUSH_ROWS", 1))
+
+CHECKPOINT_FILE = "checkpoint.json"
+RESULTS_DIR = "results"
+
+
+def _write_atomic(path: Path, write) -> None:
+    tmp_path = path.with_name(f".{path.name}.{secrets.token_hex(3)}.tmp")
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+class EvalRun:
+    """
+    A named, resumable offline evaluation run in EVAL_RUNS_DIR/<name>:
+    - checkpoint.json: the generated questions and, per question, the
+      log record id of its answer
+    - results/part-*.parquet: one row per evaluated record, appended in
+      parts; the ids in them are what counts as evaluated
+    Restarting a run with the same name skips every LLM call whose
+    output is already persisted.
+    """
+
+    def __init__(self, name: str, runs_dir: Path = EVAL_RUNS_DIR, flush_rows: int = EVAL_FLUSH_ROWS):
+        self.name = name
+        self.path = Path(runs_dir) / name
+        self.results_path = self.path / RESULTS_DIR
+        self.results_path.mkdir(parents=True, exist_ok=True)
+        self.flush_rows = flush_rows
+
+        self.questions: Optional[List[str]] = None
+        self.answered: Dict[str, str] = {}
+        self.created = datetime.now().isoformat()
+        self._pending: List[Dict[str, Any]] = []
+
+        checkpoint_path = self.path / CHECKPOINT_FILE
+        if checkpoint_path.exists():
+            with checkpoint_path.open("r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            self.questions = checkpoint["questions"]
+            self.answered = checkpoint["answered"]
+            self.created = checkpoint["created"]
+
+        self.evaluated: Set[str] = set(self._read_results()["record_id"]) if self._parts() else set()
+
+    @staticmethod
+    def new_name() -> str:
+        return datetime.now().strftime("run_%Y%m%d_%H%M%S")
+
+    def save_checkpoint(self) -> None:
+        checkpoint = {
+            "name": self.name,
+            "created": self.created,
+            "questions": self.questions,
+            "answered": self.answered,
+        }
+
+        def write(tmp_path):
+            with tmp_path.open("w", encoding="utf-8") as f:
+                json.dump(checkpoint, f, indent=2)
+
+        _write_atomic(self.path / CHECKPOINT_FILE, write)
+
+    # ---------- Progress ----------
+
+    def set_questions(self, questions: List[str]) -> None:
+        self.questions = list(questions)
+        self.save_checkpoint()
+
+    def pending_questions(self) -> List[int]:
+        return [i for i in range(len(self.questions or [])) if str(i) not in self.answered]
+
+    def mark_answered(self, question_index: int, record_id: str) -> None:
+        self.answered[str(question_index)] = record_id
+        self.save_checkpoint()
+
+    def forget_answer(self, record_id: str) -> None:
+        # The question goes back to pending, e.g. when its log record was lost
+        self.answered = {i: r for i, r in self.answered.items() if r != record_id}
+        self.save_checkpoint()
+
+    def pending_records(self) -> List[str]:
+        return [r for r in self.answered.values() if r not in self.evaluated]
+
+    # ---------- Results ----------
+
+    def _parts(self) -> List[Path]:
+        return sorted(self.results_path.glob("part-*.parquet"))
+
+    def add_result(self, row: Dict[str, Any]) -> None:
+        self._pending.append(row)
+        if len(self._pending) >= self.flush_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+
+        part = self.results_path / f"part-{len(self._parts()):05d}-{secrets.token_hex(3)}.parquet"
+        frame = pd.DataFrame(self._pending)
+        _write_atomic(part, lambda tmp_path: frame.to_parquet(tmp_path, index=False))
+
+        self.evaluated.update(row["record_id"] for row in self._pending)
+        self._pending = []
+
+    def _read_results(self) -> pd.DataFrame:
+        # Parts can differ in columns (check names come from the LLM)
+        return pd.concat([pd.read_parquet(p) for p in self._parts()], ignore_index=True)
+
+    def results(self) -> pd.DataFrame:
+        self.flush()
+        if not self._parts():
+            return pd.DataFrame()
+        return self._read_results()
@@ -1,32 +1,440 @@
 # indexes.py
-from minsearch import Index, VectorSearch
-from sentence_transformers import SentenceTransformer
+import os
+import json
+import pickle
+import shutil
+import time
+import secrets
+import threading
+import contextlib
 import numpy as np
-from typing import List, Dict, Any
+import pandas as pd
+from pathlib import Path
+from scipy.sparse import csr_matrix
+from minsearch import Index
+from typing import List, Dict, Any, Iterable, Optional, Set
+
+from embeddings import (
+    EmbeddingPool,
+    embed_texts,
+    embedder_id,
+    load_embedding_model,
+    DEFAULT_BATCH_SIZE,
+    EMBEDDING_BACKEND,
+)
+from embedding_cache import EmbeddingCache
+from metrics import startup, traced
+from chunking import chunking_config
+try:
+    import fcntl
+except ImportError:  # Windows: single-process use only
+    fcntl = None
+
+from vector_index import (
+    VECTOR_BACKEND,
+    VECTOR_BACKENDS,
+    VECTOR_DTYPE,
+    IVFVectorIndex,
+    resolve_backend,
+)
+
+# e.g. all-MiniLM-L6-v2 for a smaller, faster model
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "all-mpnet-base-v2")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", 0))
+USE_EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "1") != "0"
+INDEX_SNAPSHOT_DIR = Path(os.getenv("INDEX_SNAPSHOT_DIR", ".cache/index"))
+
+SNAPSHOT_FORMAT_VERSION = 4
+# Replaced snapshot versions are deleted only after this long, so a
+# process that has just resolved the old one can finish loading it
+SNAPSHOT_GC_GRACE_SECONDS = 600
+TEXT_FIELDS = ["title", "section", "filename"]
+KEYWORD_FIELDS = ["content_type"]
+
 
 class RepoIndexes:
-    def __init__(self, chunks: List[Dict[str, Any]]):
+    def __init__(
+        self,
+        chunks: List[Dict[str, Any]],
+        batch_size: int = EMBED_BATCH_SIZE,
+        num_workers: int = EMBED_WORKERS,
+        use_cache: bool = USE_EMBEDDING_CACHE,
+    ):
+        self._build([chunks], batch_size, num_workers, use_cache)
+
+    @classmethod
+    def from_chunk_batches(
+        cls,
+        batches: Iterable[List[Dict[str, Any]]],
+        batch_size: int = EMBED_BATCH_SIZE,
+        num_workers: int = EMBED_WORKERS,
+        use_cache: bool = USE_EMBEDDING_CACHE,
+    ) -> "RepoIndexes":
+        """
+        Builds indexes from a stream of chunk batches, embedding each
+        batch as soon as it arrives.
+        """
+        self = cls.__new__(cls)
+        self._build(batches, batch_size, num_workers, use_cache)
+        return self
+
+    @classmethod
+    def from_embeddings(
+        cls,
+        chunks: List[Dict[str, Any]],
+        embeddings: np.ndarray,
+        model=None,
+    ) -> "RepoIndexes":
+        """
+        Indexes over chunks embedded elsewhere (with the configured
+        model and backend); model, if given, is used for queries.
+        """
+        self = cls.__new__(cls)
+        self._init_model()
+        self._embedding_model = model
+        self._fit(chunks, embeddings)
+        return self
+
+    def _init_model(
+        self,
+        model_name: str = EMBEDDING_MODEL_NAME,
+        backend: str = EMBEDDING_BACKEND,
+    ) -> None:
+        self.model_name = model_name
+        self.embedding_backend = backend
+        self._embedding_model = None
+        self._model_lock = threading.Lock()
+        self._model_loader = None
+
+    def _build(
+        self,
+        batches: Iterable[List[Dict[str, Any]]],
+        batch_size: int,
+        num_workers: int,
+        use_cache: bool,
+    ) -> None:
+        self._init_model()
+
+        cache = EmbeddingCache(model_name=self.embedder_id) if use_cache else None
+        chunks = []
+        parts = []
+
+        # Workers start once for the whole stream, not per batch
+        with EmbeddingPool(lambda: self.embedding_model, num_workers) as pool:
+            for batch in batches:
+                if not batch:
+                    continue
+                parts.append(
+                    self._embed_chunks(batch, batch_size, num_workers, cache, pool)
+                )
+                chunks.extend(batch)
+
+        if cache is not None:
+            cache.flush()
+
+        embeddings = (
+            np.vstack(parts) if parts else np.empty((0, 0), dtype=np.float32)
+        )
+        self._fit(chunks, embeddings)
+
+    @traced("index.fit")
+    def _fit(
+        self,
+        chunks: List[Dict[str, Any]],
+        embeddings: np.ndarray,
+        centroids: Optional[np.ndarray] = None,
+    ) -> None:
         self.chunks = chunks
+        # Changes on every (re)build; caches keyed on it go stale with it
+        self.version = secrets.token_hex(8)
 
         # 1 Keyword / text index
         self.text_index = Index(
-            text_fields=["title", "section", "filename"],
-            keyword_fields=["content_type"]
+            text_fields=TEXT_FIELDS,
+            keyword_fields=KEYWORD_FIELDS
         )
         self.text_index.fit(chunks)
 
-        # 2 Vector index
-        self.embedding_model = SentenceTransformer("all-mpnet-base-v2")
-        embeddings = np.array([
-            self.embedding_model.encode(self._build_text(chunk))
-            for chunk in chunks
-        ])
+        # 2 Vector index (exact or ANN, see vector_index.py)
+        backend = resolve_backend(len(chunks))
+        self.vector_index = VECTOR_BACKENDS[backend](keyword_fields=KEYWORD_FIELDS)
+        if centroids is not None and backend == IVFVectorIndex.name:
+            self.vector_index.fit(embeddings, chunks, centroids=centroids)
+        else:
+            self.vector_index.fit(embeddings, chunks)
+
+    def update(
+        self,
+        new_chunks: List[Dict[str, Any]],
+        removed_filenames: Set[str],
+        batch_size: int = EMBED_BATCH_SIZE,
+        num_workers: int = EMBED_WORKERS,
+        use_cache: bool = USE_EMBEDDING_CACHE,
+    ) -> None:
+        """
+        Applies a file-level change set in place:
+        - drops every chunk of removed (or changed) files from both indexes
+        - embeds only the new chunks, reusing all other vectors
+        - refits TF-IDF over the result (IDF is global, and cheap to fit)
+        - reuses trained IVF centroids, only reassigning vectors to lists
+        """
+        keep = [
+            i for i, chunk in enumerate(self.chunks)
+            if chunk["filename"] not in removed_filenames
+        ]
+        chunks = [self.chunks[i] for i in keep] + list(new_chunks)
+        embeddings = np.asarray(self.vector_index.vectors)[keep]
+
+        if new_chunks:
+            cache = EmbeddingCache(model_name=self.embedder_id) if use_cache else None
+            new_embeddings = self._embed_chunks(
+                new_chunks, batch_size, num_workers, cache
+            )
+            if cache is not None:
+                cache.flush()
+            embeddings = np.vstack([
+                embeddings.reshape(-1, new_embeddings.shape[1]),
+                new_embeddings,
+            ])
 
-        self.vector_index = VectorSearch()
-        self.vector_index.fit(embeddings, chunks)
+        self._fit(
+            chunks,
+            embeddings,
+            centroids=getattr(self.vector_index, "centroids", None),
+        )
 
-    
-    def _build_text(self, chunk: Dict[str, Any]) -> str:
+    @property
+    def embedding_model(self):
+        """
+        Loaded on first use, so a fully cached start never pays for it.
+        """
+        if self._embedding_model is None:
+            with self._model_lock:
+                if self._embedding_model is None:
+                    self._embedding_model = load_embedding_model(
+                        self.model_name, self.embedding_backend
+                    )
+        return self._embedding_model
+
+    @property
+    def loaded_model(self):
+        # The embedding model if something already loaded it, else None
+        return self._embedding_model
+
+    @property
+    def embedder_id(self) -> str:
+        return embedder_id(self.model_name, self.embedding_backend)
+
+    @property
+    def model_ready(self) -> bool:
+        # False only while a background load is in flight; otherwise the
+        # model loads on first use as before
+        return self._model_loader is None or self._embedding_model is not None
+
+    def load_model_in_background(self) -> threading.Thread:
+        """
+        Loads the embedding model on a daemon thread; until it is ready
+        searches run keyword-only.
+        """
+        def load():
+            self.embedding_model
+            startup.mark("embedding model ready")
+
+        self._model_loader = threading.Thread(target=load, name="model-loader", daemon=True)
+        self._model_loader.start()
+        return self._model_loader
+
+    def _embed_chunks(
+        self,
+        chunks: List[Dict[str, Any]],
+        batch_size: int,
+        num_workers: int,
+        cache: Optional[EmbeddingCache],
+        pool: Optional[EmbeddingPool] = None,
+    ) -> np.ndarray:
+        """
+        Embeds chunks, only encoding those missing from the on-disk cache.
+        """
+        texts = [self._build_text(chunk) for chunk in chunks]
+
+        if cache is None:
+            return embed_texts(
+                self.embedding_model,
+                texts,
+                batch_size,
+                num_workers,
+                pool.get() if pool is not None else None,
+            )
+
+        embeddings, missing = cache.lookup(texts)
+
+        if not missing:
+            return embeddings
+
+        missing_texts = [texts[i] for i in missing]
+        fresh = embed_texts(
+            self.embedding_model,
+            missing_texts,
+            batch_size,
+            num_workers,
+            pool.get() if pool is not None else None,
+        )
+
+        if embeddings is None:
+            embeddings = np.empty((len(texts), fresh.shape[1]), dtype=np.float32)
+        embeddings[missing] = fresh
+        cache.add(missing_texts, fresh)
+
+        return embeddings
+
+    def save(
+        self,
+        path: Path = INDEX_SNAPSHOT_DIR,
+        manifest: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Writes a snapshot directory:
+        - meta.json: format version, model, shapes
+        - manifest.json: per-file CRC/size of the indexed sources, if given
+        - chunks.json: the chunk table
+        - vectorizers.pkl: fitted TF-IDF vocabularies
+        - text_<field>_{data,indices,indptr}.npy: sparse text matrices
+        - embeddings.npy (+ quantized / ivf_*.npy): vector index arrays
+
+        path is a symlink to a versioned directory (<name>.v-<hex>). The
+        new version is written next to the old one and the link replaced
+        with a rename, so readers always find a whole snapshot, old or
+        new, and concurrent savers never see a missing directory.
+        """
+        path = Path(path)
+        version_path = path.with_name(f"{path.name}.v-{secrets.token_hex(4)}")
+        version_path.mkdir(parents=True)
+
+        text_shapes = {}
+        for field, matrix in self.text_index.text_matrices.items():
+            matrix = csr_matrix(matrix)
+            np.save(version_path / f"text_{field}_data.npy", matrix.data)
+            np.save(version_path / f"text_{field}_indices.npy", matrix.indices)
+            np.save(version_path / f"text_{field}_indptr.npy", matrix.indptr)
+            text_shapes[field] = list(matrix.shape)
+
+        self.vector_index.save(version_path)
+
+        with (version_path / "vectorizers.pkl").open("wb") as f:
+            pickle.dump(self.text_index.vectorizers, f)
+
+        with (version_path / "chunks.json").open("w", encoding="utf-8") as f:
+            json.dump(self.chunks, f)
+
+        if manifest is not None:
+            with (version_path / "manifest.json").open("w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+
+        meta = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "model": self.model_name,
+            "embedding_backend": self.embedding_backend,
+            "version": self.version,
+            "chunking": chunking_config(),
+            "vector_backend": VECTOR_BACKEND,
+            "vector_index": self.vector_index.name,
+            "vector_dtype": self.vector_index.dtype,
+            "num_chunks": len(self.chunks),
+            "text_fields": TEXT_FIELDS,
+            "keyword_fields": KEYWORD_FIELDS,
+            "text_shapes": text_shapes,
+        }
+        with (version_path / "meta.json").open("w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+        link_path = path.with_name(f"{path.name}.{secrets.token_hex(3)}.link")
+        os.symlink(version_path.name, link_path)
+
+        with _snapshot_lock(path):
+            replaced = path.resolve() if path.is_symlink() else None
+            if replaced is None and path.exists():
+                # A snapshot from before versioned directories, moved aside once
+                replaced = path.with_name(f"{path.name}.v-{secrets.token_hex(4)}")
+                os.replace(path, replaced)
+            if replaced is not None and replaced.exists():
+                # The replaced version's grace period starts now
+                os.utime(replaced)
+            os.replace(link_path, path)
+            _collect_snapshot_garbage(path)
+
+    @classmethod
+    def load(
+        cls,
+        path: Path = INDEX_SNAPSHOT_DIR,
+        mmap: bool = True,
+        model=None,
+    ) -> "RepoIndexes":
+        """
+        Restores a snapshot written by save() without refitting anything.
+        With mmap=True the matrices are mapped read-only, so several
+        processes loading the same snapshot share the same pages.
+        model, if given, is an already loaded embedding model for the
+        snapshot's model and backend (e.g. the one that just built it),
+        so it isn't loaded a second time.
+        """
+        # Every file is read from the same version, even if a save
+        # replaces the link meanwhile
+        path = Path(path).resolve()
+        meta = read_snapshot_meta(path)
+        if meta is None:
+            raise FileNotFoundError(f"No index snapshot at {path}")
+        if meta["format_version"] != SNAPSHOT_FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported index snapshot version {meta['format_version']}"
+            )
+
+        mmap_mode = "r" if mmap else None
+
+        with (path / "chunks.json").open("r", encoding="utf-8") as f:
+            chunks = json.load(f)
+
+        with (path / "vectorizers.pkl").open("rb") as f:
+            vectorizers = pickle.load(f)
+
+        self = cls.__new__(cls)
+        self.chunks = chunks
+        self.version = meta["version"]
+        self._init_model(meta["model"], meta.get("embedding_backend", "torch"))
+        self._embedding_model = model
+
+        self.text_index = Index(
+            text_fields=meta["text_fields"],
+            keyword_fields=meta["keyword_fields"]
+        )
+        self.text_index.docs = chunks
+        self.text_index.vectorizers = vectorizers
+        for field, shape in meta["text_shapes"].items():
+            self.text_index.text_matrices[field] = csr_matrix(
+                (
+                    np.load(path / f"text_{field}_data.npy", mmap_mode=mmap_mode),
+                    np.load(path / f"text_{field}_indices.npy", mmap_mode=mmap_mode),
+                    np.load(path / f"text_{field}_indptr.npy", mmap_mode=mmap_mode),
+                ),
+                shape=tuple(shape),
+            )
+        self.text_index.keyword_df = pd.DataFrame({
+            field: [chunk.get(field) for chunk in chunks]
+            for field in meta["keyword_fields"]
+        })
+
+        self.vector_index = VECTOR_BACKENDS[meta["vector_index"]].load(
+            path,
+            chunks,
+            keyword_fields=meta["keyword_fields"],
+            mmap=mmap,
+            dtype=meta["vector_dtype"],
+        )
+
+        return self
+
+    @staticmethod
+    def _build_text(chunk: Dict[str, Any]) -> str:
         """
         Canonical text used for embeddings.
         """
@@ -40,3 +448,57 @@ class RepoIndexes:
                 ],
             )
         )
+
+
+@contextlib.contextmanager
+def _snapshot_lock(path: Path):
+    # Serializes snapshot swaps between processes
+    with path.with_name(f"{path.name}.lock").open("a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _collect_snapshot_garbage(path: Path) -> None:
+    # Versions the link no longer points at, once past the grace period;
+    # processes that mapped their files keep their pages
+    current = path.resolve()
+    cutoff = time.time() - SNAPSHOT_GC_GRACE_SECONDS
+    for version in path.parent.glob(f"{path.name}.v-*"):
+        if version != current and version.stat().st_mtime < cutoff:
+            shutil.rmtree(version, ignore_errors=True)
+
+
+def read_snapshot_meta(path: Path = INDEX_SNAPSHOT_DIR):
+    meta_path = Path(path) / "meta.json"
+    if not meta_path.exists():
+        return None
+    with meta_path.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_snapshot_manifest(path: Path = INDEX_SNAPSHOT_DIR):
+    """
+    Source manifest of a snapshot this code can load, else None.
+    """
+    meta = read_snapshot_meta(path)
+    if (
+        meta is None
+        or meta["format_version"] != SNAPSHOT_FORMAT_VERSION
+        or meta["model"] != EMBEDDING_MODEL_NAME
+        or meta.get("embedding_backend", "torch") != EMBEDDING_BACKEND
+        or meta.get("chunking") != chunking_config()
+        or meta.get("vector_backend") != VECTOR_BACKEND
+        or meta.get("vector_dtype") != VECTOR_DTYPE
+    ):
+        return None
+
+    manifest_path = Path(path) / "manifest.json"
+    if not manifest_path.exists():
+        return None
+    with manifest_path.open("r", encoding="utf-8") as f:
+        return json.load(f)
@@ -1,10 +1,16 @@
+import os
+import json
+import time
+import zlib
 import zipfile
 import requests
 import frontmatter
 from pathlib import Path
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Set, Tuple
+
+from metrics import traced, traced_iter
 
 
 GITHUB_ZIP_URL = (
@@ -13,22 +19,53 @@ GITHUB_ZIP_URL = (
 )
 
 ZIP_PATH = Path("repo.zip")
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", 1024 * 1024))
+PROGRESS_INTERVAL_SECONDS = 0.5
+
+# Read docs from a local directory / git checkout instead of the ZIP
+DOCS_DIR = os.getenv("DOCS_DIR")
 
 ALLOWED_FILES = {"readme.md", "assignment.md"}
 EXCLUDE_DIRS = {"/translations/"}
 
-def download_github_zip(url: str, out_path: Path) -> None:
+def _read_json(path: Path) -> Dict[str, Any]:
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except ValueError:
+        return {}
+
+
+def _write_json(path: Path, data: Dict[str, Any]) -> None:
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(data, f)
+
+
+@traced("ingest.download")
+def download_github_zip(
+    url: str,
+    out_path: Path,
+    chunk_size: int = DOWNLOAD_CHUNK_SIZE,
+    progress_interval: float = PROGRESS_INTERVAL_SECONDS,
+) -> bool:
     """
     Downloads a GitHub repository ZIP with retries and streaming.
-    Deletes any partial file on failure.
+    - conditional: sends If-None-Match / If-Modified-Since from the last
+      download, so an unchanged archive is not fetched again
+    - resumable: streams into <out>.part and continues an interrupted
+      download with a Range request
+    - atomic: the .part file is renamed over out_path only when complete
+
+    Returns True if a new archive was downloaded, False if unchanged.
     """
-      
-    # out = Path(out_path)
+    meta_path = out_path.with_name(out_path.name + ".meta.json")
+    part_path = out_path.with_name(out_path.name + ".part")
+    part_meta_path = out_path.with_name(out_path.name + ".part.json")
 
-    # Delete existing file (fresh download)
-    if out_path.exists():
-        out_path.unlink()
-        print(f"Deleted existing file: {out_path.name}")
+    meta = _read_json(meta_path)
+    part_meta = _read_json(part_meta_path)
 
     # Prepare session with retries
     session = requests.Session()
@@ -39,36 +76,92 @@ def download_github_zip(url: str, out_path: Path) -> None:
         allowed_methods=["GET"],
     )
     session.mount("https://", HTTPAdapter(max_retries=retries))
+    session.mount("http://", HTTPAdapter(max_retries=retries))
+
+    headers = {}
+    if out_path.exists() and meta.get("url") == url:
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+    resume_from = 0
+    if part_path.exists() and part_meta.get("url") == url:
+        validator = part_meta.get("etag") or part_meta.get("last_modified")
+        if validator and part_path.stat().st_size > 0:
+            resume_from = part_path.stat().st_size
+            headers["Range"] = f"bytes={resume_from}-"
+            headers["If-Range"] = validator
 
     # Download with streaming
     try:
-        with session.get(url, stream=True, timeout=(5, 60)) as r:
+        with session.get(url, headers=headers, stream=True, timeout=(5, 60)) as r:
+            if r.status_code == 304:
+                print(f"{out_path.name} not modified, skipping download")
+                return False
+
+            if r.status_code == 416:
+                # Stale partial file (archive changed size): start over
+                part_path.unlink(missing_ok=True)
+                part_meta_path.unlink(missing_ok=True)
+                return download_github_zip(url, out_path, chunk_size, progress_interval)
+
             r.raise_for_status()
 
+            validators = {
+                "url": url,
+                "etag": r.headers.get("ETag"),
+                "last_modified": r.headers.get("Last-Modified"),
+            }
+
+            if r.status_code == 206:
+                print(f"Resuming download at {resume_from // 1024} KB")
+                mode = "ab"
+                downloaded = resume_from
+            else:
+                mode = "wb"
+                downloaded = 0
+                _write_json(part_meta_path, validators)
+
             total = int(r.headers.get("Content-Length", 0))
-            downloaded = 0
+            if total:
+                total += downloaded
 
-            with open(out_path, "wb") as f:
-                for chunk in r.iter_content(chunk_size=4096):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded += len(chunk)
+            last_report = 0.0
 
-                        if total:
-                            percent = (downloaded / total) * 100
-                            print(
-                                f"\rDownloading: {percent:.2f}% "
-                                f"({downloaded // 1024} KB)",
-                                end=""
-                            )
+            with open(part_path, mode) as f:
+                for chunk in r.iter_content(chunk_size=chunk_size):
+                    if not chunk:
+                        continue
+                    f.write(chunk)
+                    downloaded += len(chunk)
 
-        print("\nDownload completed")
+                    now = time.monotonic()
+                    if total and now - last_report >= progress_interval:
+                        last_report = now
+                        percent = (downloaded / total) * 100
+                        print(
+                            f"\rDownloading: {percent:.2f}% "
+                            f"({downloaded // 1024} KB)",
+                            end=""
+                        )
+
+            if total and downloaded != total:
+                raise IOError(
+                    f"Incomplete download: {downloaded} of {total} bytes"
+                )
+
+        os.replace(part_path, out_path)
+        part_meta_path.unlink(missing_ok=True)
+        _write_json(meta_path, validators)
+        print(f"\nDownload completed ({downloaded // 1024} KB)")
+        return True
 
     except Exception as e:
-        # Cleanup on failure
-        if out_path.exists():
-            out_path.unlink()
-        raise RuntimeError("Download failed and partial file removed") from e
+        # The .part file is kept so the next run can resume it
+        raise RuntimeError(
+            f"Download failed; partial data kept in {part_path.name}"
+        ) from e
 
 
 def extract_title(section: str) -> str:
@@ -84,41 +177,148 @@ def detect_content_type(filename: str) -> str:
     """
     return "assignment" if "assignment" in filename.lower() else "learning"
 
-def extract_markdown_from_zip(zip_path: Path) -> List[Dict[str, Any]]:
+def is_indexed_markdown(filename: str) -> bool:
+    """
+    Whether a ZIP member is one of the markdown files we index.
+    """
+    name = filename.lower()
+
+    if not (name.endswith(".md") or name.endswith(".mdx")):
+        return False
+
+    if filename.split("/")[-1] not in ALLOWED_FILES:
+        return False
+
+    if any(d in filename for d in EXCLUDE_DIRS):
+        return False
+
+    return True
+
+
+def _iter_directory_files(root: Path) -> Iterator[Tuple[str, Path]]:
     """
-    Reads allowed markdown files from ZIP and extracts frontmatter + content.
+    Yields (filename, path) for indexed files under a local directory or
+    git checkout. Filenames are prefixed with the directory name, like
+    the top-level folder inside a GitHub ZIP.
     """
-    documents = []
+    for path in sorted(root.rglob("*")):
+        rel = path.relative_to(root)
+        if ".git" in rel.parts or not path.is_file():
+            continue
+        filename = f"{root.name}/{rel.as_posix()}"
+        if is_indexed_markdown(filename):
+            yield filename, path
+
 
+def build_zip_manifest(zip_path: Path) -> Dict[str, Dict[str, int]]:
+    """
+    Per-file CRC and size of indexed files, read from the ZIP
+    central directory only (no member is decompressed).
+    """
     with zipfile.ZipFile(zip_path, "r") as zf:
-        for info in zf.infolist():
-            filename = info.filename
-            name = filename.lower()
+        return {
+            info.filename: {"crc": info.CRC, "size": info.file_size}
+            for info in zf.infolist()
+            if is_indexed_markdown(info.filename)
+        }
+
+
+def build_manifest(source: Path) -> Dict[str, Dict[str, int]]:
+    """
+    Per-file CRC and size for a ZIP archive or a local directory.
+    """
+    if not source.is_dir():
+        return build_zip_manifest(source)
+
+    manifest = {}
+    for filename, path in _iter_directory_files(source):
+        data = path.read_bytes()
+        manifest[filename] = {"crc": zlib.crc32(data), "size": len(data)}
+    return manifest
+
 
-            if not (name.endswith(".md") or name.endswith(".mdx")):
+def diff_manifests(
+    old: Dict[str, Dict[str, int]],
+    new: Dict[str, Dict[str, int]],
+) -> Tuple[Set[str], Set[str], Set[str]]:
+    """
+    Returns (added, changed, removed) filenames between two manifests.
+    """
+    added = new.keys() - old.keys()
+    removed = old.keys() - new.keys()
+    changed = {
+        filename for filename in new.keys() & old.keys()
+        if new[filename] != old[filename]
+    }
+    return set(added), changed, set(removed)
+
+
+def _parse_markdown(filename: str, raw: bytes) -> Dict[str, Any]:
+    post = frontmatter.loads(raw)
+    doc = post.to_dict()
+    doc["content"] = post.content
+    doc["filename"] = filename
+    return doc
+
+
+def iter_markdown_documents(
+    source: Path,
+    only: Optional[Set[str]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Streams documents one at a time from a ZIP archive or a local
+    directory / git checkout. ZIP members are selected using the
+    central directory only, and each is read and parsed as it is
+    reached, so the archive is never buffered as a whole.
+    If only is given, just those files are read.
+
+    Traced as one ingest.extract span over the whole stream.
+    """
+    return traced_iter(
+        "ingest.extract", _iter_markdown_documents(source, only), source=source.name
+    )
+
+
+def _iter_markdown_documents(
+    source: Path,
+    only: Optional[Set[str]],
+) -> Iterator[Dict[str, Any]]:
+    if source.is_dir():
+        for filename, path in _iter_directory_files(source):
+            if only is not None and filename not in only:
                 continue
+            yield _parse_markdown(filename, path.read_bytes())
+        return
 
-            if filename.split("/")[-1] not in ALLOWED_FILES:
+    with zipfile.ZipFile(source, "r") as zf:
+        for info in zf.infolist():
+            filename = info.filename
+
+            if not is_indexed_markdown(filename):
                 continue
 
-            if any(d in filename for d in EXCLUDE_DIRS):
+            if only is not None and filename not in only:
                 continue
 
             with zf.open(info) as f:
-                post = frontmatter.loads(f.read())
-                doc = post.to_dict()
-                doc["content"] = post.content
-                doc["filename"] = filename
-                documents.append(doc)
+                yield _parse_markdown(filename, f.read())
+
 
-    return documents
+def fetch_docs_source() -> Path:
+    """
+    Local docs directory if DOCS_DIR is set, else the (conditionally)
+    downloaded GitHub ZIP.
+    """
+    if DOCS_DIR:
+        return Path(DOCS_DIR)
+    download_github_zip(GITHUB_ZIP_URL, ZIP_PATH)
+    return ZIP_PATH
 
 
 def load_raw_documents() -> List[Dict[str, Any]]:
     """
     End-to-end ingestion:
-    - download repo
+    - download repo (or use DOCS_DIR)
     - extract markdown
     """
-    download_github_zip(GITHUB_ZIP_URL, ZIP_PATH)
-    return extract_markdown_from_zip(ZIP_PATH)
\ No newline at end of file
+    return list(iter_markdown_documents(fetch_docs_source()))
\ No newline at end of file
@@ -0,0 +1,283 @@
+# log_store.py
+import os
+import json
+import time
+import queue
+import atexit
+import sqlite3
+import secrets
+import threading
+from pathlib import Path
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+LOG_SEGMENT_MAX_MB = float(os.getenv("LOG_SEGMENT_MAX_MB", 64))
+LOG_SEGMENT_MAX_AGE_HOURS = float(os.getenv("LOG_SEGMENT_MAX_AGE_HOURS", 24))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", 0.2))
+LOG_BATCH_SIZE = int(os.getenv("LOG_BATCH_SIZE", 256))
+
+INDEX_FILE = "index.sqlite"
+SEGMENT_GLOB = "segment-*.jsonl"
+
+_STOP = object()
+
+
+def serializer(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+class LogStore:
+    """
+    Append-only interaction log:
+    - records are JSON lines in segment-<time>-<hex>.jsonl files, rotated
+      by size (max_segment_mb) or age (max_segment_age_hours)
+    - a writer thread appends queued records in batches, one fsync per
+      batch (group commit)
+    - index.sqlite maps id -> (segment, offset, length) plus source,
+      agent_name and timestamp, so filtered loads only read matching lines
+    """
+
+    def __init__(
+        self,
+        log_dir: Path,
+        max_segment_mb: float = LOG_SEGMENT_MAX_MB,
+        max_segment_age_hours: float = LOG_SEGMENT_MAX_AGE_HOURS,
+        flush_interval: float = LOG_FLUSH_INTERVAL,
+        batch_size: int = LOG_BATCH_SIZE,
+    ):
+        self.log_dir = Path(log_dir)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.max_segment_bytes = max_segment_mb * 1024 * 1024
+        self.max_segment_age = max_segment_age_hours * 3600
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self.index_path = self.log_dir / INDEX_FILE
+        rebuild = not self.index_path.exists()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS records (
+                    id TEXT PRIMARY KEY,
+                    segment TEXT NOT NULL,
+                    offset INTEGER NOT NULL,
+                    length INTEGER NOT NULL,
+                    source TEXT,
+                    agent_name TEXT,
+                    timestamp TEXT
+                )
+                """
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS records_source ON records (source, timestamp)")
+            db.execute("CREATE INDEX IF NOT EXISTS records_agent ON records (agent_name, timestamp)")
+        if rebuild:
+            self.rebuild_index()
+
+        self._segment = None
+        self._segment_file = None
+        self._segment_opened = 0.0
+
+        self._queue = queue.Queue()
+        self._errors: List[Exception] = []
+        self._closed = False
+        self._writer = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.index_path, timeout=30)
+
+    # ---------- Writing ----------
+
+    def append(self, entry: Dict[str, Any]) -> str:
+        """
+        Queues a record for the writer thread and returns its id.
+        The record is serialized here, so the caller may reuse entry.
+        """
+        if self._closed:
+            raise RuntimeError("log store is closed")
+
+        record_id = entry.get("id") or secrets.token_hex(8)
+        entry["id"] = record_id
+        line = (json.dumps(entry, default=serializer) + "\n").encode("utf-8")
+        meta = (
+            record_id,
+            entry.get("source"),
+            entry.get("agent_name"),
+            serializer(entry["timestamp"]) if isinstance(entry.get("timestamp"), datetime) else entry.get("timestamp"),
+        )
+        self._queue.put((line, meta))
+        return record_id
+
+    def flush(self) -> None:
+        """
+        Blocks until everything appended so far is on disk and indexed;
+        raises if the writer failed to write any of it since the last
+        flush (those records are lost).
+        """
+        self._queue.join()
+        if self._errors:
+            errors, self._errors = self._errors, []
+            raise RuntimeError(
+                f"log store failed to write {len(errors)} batches: {errors[0]!r}"
+            ) from errors[0]
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+
+    def _rotate_if_needed(self) -> None:
+        if self._segment_file is not None:
+            too_big = self._segment_file.tell() >= self.max_segment_bytes
+            too_old = time.time() - self._segment_opened >= self.max_segment_age
+            if not (too_big or too_old):
+                return
+            self._segment_file.close()
+
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._segment = f"segment-{stamp}-{secrets.token_hex(3)}.jsonl"
+        self._segment_file = (self.log_dir / self._segment).open("ab")
+        self._segment_opened = time.time()
+
+    def _collect(self) -> List[Any]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and batch[-1] is not _STOP:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, db: sqlite3.Connection, items) -> None:
+        rows = []
+        for line, (record_id, source, agent_name, timestamp) in items:
+            self._rotate_if_needed()
+            offset = self._segment_file.tell()
+            self._segment_file.write(line)
+            rows.append((record_id, self._segment, offset, len(line), source, agent_name, timestamp))
+
+        # Records are durable before they become visible in the index
+        self._segment_file.flush()
+        os.fsync(self._segment_file.fileno())
+
+        with db:
+            db.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def _run(self) -> None:
+        db = self._connect()
+        try:
+            while True:
+                batch = self._collect()
+                items = [item for item in batch if item is not _STOP]
+                try:
+                    if items:
+                        self._write_batch(db, items)
+                except Exception as e:
+                    print(f"[LogStore] failed to write {len(items)} records: {e!r}")
+                    # Raised by the next flush()
+                    self._errors.append(e)
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+                if len(items) < len(batch):
+                    break
+        finally:
+            if self._segment_file is not None:
+                self._segment_file.close()
+            db.close()
+
+    # ---------- Reading ----------
+
+    def _read_rows(self, rows) -> Iterator[Dict[str, Any]]:
+        handles = {}
+        try:
+            for segment, offset, length in rows:
+                if segment not in handles:
+                    handles[segment] = (self.log_dir / segment).open("rb")
+                f = handles[segment]
+                f.seek(offset)
+                yield json.loads(f.read(length))
+        finally:
+            for f in handles.values():
+                f.close()
+
+    def query(
+        self,
+        source: Optional[str] = None,
+        agent_name: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Records matching all given filters (timestamps as ISO strings,
+        since inclusive, until exclusive), oldest first.
+        """
+        # Waits for queued records without consuming write errors
+        self._queue.join()
+
+        clauses, params = [], []
+        for column, op, value in (
+            ("source", "=", source),
+            ("agent_name", "=", agent_name),
+            ("timestamp", ">=", since),
+            ("timestamp", "<", until),
+        ):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value)
+
+        sql = "SELECT segment, offset, length FROM records"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY timestamp, segment, offset"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        with self._connect() as db:
+            rows = db.execute(sql, params).fetchall()
+        return list(self._read_rows(rows))
+
+    def get(self, record_id: str) -> Optional[Dict[str, Any]]:
+        self._queue.join()
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT segment, offset, length FROM records WHERE id = ?", (record_id,)
+            ).fetchall()
+        records = list(self._read_rows(rows))
+        return records[0] if records else None
+
+    def rebuild_index(self) -> int:
+        """
+        Re-indexes every segment from scratch (e.g. after the index file
+        was deleted); returns the number of records found.
+        """
+        rows = []
+        for path in sorted(self.log_dir.glob(SEGMENT_GLOB)):
+            offset = 0
+            with path.open("rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn last line of a crashed writer
+                        break
+                    rows.append((
+                        record.get("id"), path.name, offset, len(line),
+                        record.get("source"), record.get("agent_name"), record.get("timestamp"),
+                    ))
+                    offset += len(line)
+
+        with self._connect() as db:
+            db.execute("DELETE FROM records")
+            db.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
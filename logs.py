@@ -1,18 +1,45 @@
 import os
-import json
 import secrets
+import threading
 from pathlib import Path
-from datetime import datetime
 
 from pydantic_ai.messages import ModelMessagesTypeAdapter
+from log_store import LogStore
+from metrics import current_trace
 # from dotenv import load_dotenv
 # load_dotenv()
 
 LOG_DIR = Path(os.getenv('LOGS_DIRECTORY', 'logs'))
 LOG_DIR.mkdir(parents=True,exist_ok=True)
 
+_store = None
+_store_lock = threading.Lock()
 
-def log_entry(agent, messages, source="user"):
+
+def get_log_store() -> LogStore:
+    # One store (and writer thread) per process, opened on first use
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = LogStore(LOG_DIR)
+    return _store
+
+
+def messages_usage(dict_messages, cache_hit=False):
+    # Summed over the run's model responses; a cached answer used none
+    usage = {"requests": 0, "input_tokens": 0, "output_tokens": 0}
+    if cache_hit:
+        return usage
+
+    for message in dict_messages:
+        if message.get("kind") == "response":
+            usage["requests"] += 1
+            usage["input_tokens"] += message["usage"]["input_tokens"]
+            usage["output_tokens"] += message["usage"]["output_tokens"]
+    return usage
+
+
+def log_entry(agent, messages, source="user", cache_hit=False):
     tools = []
 
     for ts in agent.toolsets:
@@ -21,33 +48,27 @@ def log_entry(agent, messages, source="user"):
     dict_messages = ModelMessagesTypeAdapter.dump_python(messages)
 
     return {
+        "id": secrets.token_hex(8),
+        "timestamp": dict_messages[-1]["timestamp"],
         "agent_name": agent.name,
         "system_prompt": agent._instructions,
         "provider": agent.model.system,
         "model": agent.model.model_name,
         "tools": tools,
         "messages": dict_messages,
-        "source": source
+        "source": source,
+        "cache_hit": cache_hit,
+        "usage": messages_usage(dict_messages, cache_hit),
+        # Spans finished so far in the current trace (agent run, searches)
+        "trace": current_trace(),
     }
 
 
-def serializer(obj):
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    raise TypeError(f"Type {type(obj)} not serializable")
-
-
-def log_interaction_to_file(agent, messages, source='user'):
-    entry = log_entry(agent, messages, source)
-
-    ts = entry['messages'][-1]['timestamp']
-    ts_str = ts.strftime("%Y%m%d_%H%M%S")
-    rand_hex = secrets.token_hex(3)
-
-    filename = f"{agent.name}_{ts_str}_{rand_hex}.json"
-    filepath = LOG_DIR / filename
-
-    with filepath.open("w", encoding="utf-8") as f_out:
-        json.dump(entry, f_out, indent=2, default=serializer)
-
-    return entry, filepath
+def log_interaction_to_file(agent, messages, source='user', cache_hit=False):
+    """
+    Appends the interaction to the log store (written in the background)
+    and returns the entry and its record id.
+    """
+    entry = log_entry(agent, messages, source, cache_hit)
+    record_id = get_log_store().append(entry)
+    return entry, record_id
@@ -1,11 +1,10 @@
-from ingest import load_raw_documents
-from chunking import chunk_documents
-from indexes import RepoIndexes
-from tools import SearchTools
+from metrics import startup, span, record_run_usage, start_metrics_server, METRICS_PORT
+from service import build_search_tools
 from agent import build_agent
 from logs import log_interaction_to_file
-from eval import eval_agent, evaluate_log_record
+from eval import get_eval_agent, evaluate_log_record
 import os
+import time
 import asyncio
 
 # from dotenv import load_dotenv
@@ -14,17 +13,14 @@ import asyncio
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 async def main():
-    print('started')
-    docs = load_raw_documents()
-    print('docs loaded')
-    chunks = chunk_documents(docs)
-    print('chunking completed')
-    indexes = RepoIndexes(chunks)
-    print('indexes done')
-    tools = SearchTools(indexes)
-    print('in hybrid search and going to agents')
-    agent = build_agent(tools)
-    
+    # Keyword search is available right away; vector search switches
+    # on once the embedding model has loaded in the background
+    if METRICS_PORT:
+        start_metrics_server(METRICS_PORT)
+    tools = build_search_tools()
+    with startup.phase("build agent"):
+        agent = build_agent(tools)
+    startup.report()
 
     print("\nReady to answer your questions!")
     print("Type 'stop' to exit the program.\n")
@@ -36,19 +32,43 @@ async def main():
             break
 
         print("Processing your question...")
-        response = await agent.run(user_prompt=question)
-        print("\nResponse:\n", response.output)
-        log_record,log_path =log_interaction_to_file(agent, response.new_messages())
+        started = time.perf_counter()
+        first_token_at = None
 
-        # ---------- Evaluation ----------
-        evaluation = await evaluate_log_record(eval_agent, log_record)
+        # One trace per question: the agent run, its searches and the
+        # evaluation; the log entry gets the spans finished before it
+        with span("question", source="user"):
+            # Print tokens as they arrive; the full message list is
+            # available once the stream is done
+            with span("agent.run", agent=agent.name) as run_span:
+                async with agent.run_stream(user_prompt=question) as response:
+                    async for delta in response.stream_text(delta=True):
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                            run_span.set(ttft=first_token_at - started)
+                            print("\nResponse:\n", end="")
+                        print(delta, end="", flush=True)
+                    messages = response.new_messages()
+                record_run_usage(agent.name, response)
+
+            if first_token_at is not None:
+                print(f"\n\n(time to first token: {first_token_at - started:.2f}s)")
+
+            log_record,log_id =log_interaction_to_file(
+                agent,
+                messages,
+                cache_hit=getattr(response, "cache_hit", False)
+            )
+
+            # ---------- Evaluation ----------
+            evaluation = await evaluate_log_record(get_eval_agent(), log_record)
         print("\nEvaluation Summary:\n", evaluation.summary)
 
         for check in evaluation.checklist:
             status = "✅" if check.check_pass else "❌"
             print(f"{status} {check.check_name}: {check.justification}")
 
-        print(f"\nLog saved at: {log_path}")
+        print(f"\nLog id: {log_id}")
         print("\n" + "="*50 + "\n")
 
 
@@ -0,0 +1,369 @@
+# metrics.py
+import os
+import json
+import time
+import atexit
+import bisect
+import secrets
+import functools
+import threading
+from pathlib import Path
+from datetime import datetime
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+# Finished traces are appended here as JSON lines; empty = not exported
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+# Prometheus text file written at exit (e.g. after an offline eval run)
+METRICS_FILE = os.getenv("METRICS_FILE", "")
+# Front-ends serve /metrics on this port when set
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class PhaseTimer:
+    """
+    Wall-clock timing of named phases (e.g. startup):
+    - phase(name) times a block
+    - mark(name) records an event, such as a background load finishing,
+      at its offset from the start
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+        self.marks: List[Tuple[str, float]] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.phases.append((name, elapsed))
+            print(f"[{self.name}] {name}: {elapsed:.2f}s")
+
+    def mark(self, name: str) -> float:
+        offset = time.perf_counter() - self.started
+        with self._lock:
+            self.marks.append((name, offset))
+        print(f"[{self.name}] {name} at +{offset:.2f}s")
+        return offset
+
+    def report(self) -> None:
+        total = time.perf_counter() - self.started
+        print(f"[{self.name}] ready in {total:.2f}s")
+        for name, elapsed in self.phases:
+            print(f"  {name:<24} {elapsed:7.2f}s")
+
+
+# Process-wide startup timeline, shared by the front-ends and indexes
+startup = PhaseTimer("startup")
+
+
+# ---------- Metrics (Prometheus text format) ----------
+
+# Histogram buckets in seconds, from a cached search to a slow LLM call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_text(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    labels = _label_text(self.labelnames, key, f'le="{le}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {total:g}")
+                lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[Any] = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+    def write_textfile(self, path: Path) -> None:
+        # Atomic, for node_exporter's textfile collector or a later diff
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(self.render(), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+
+registry = MetricsRegistry()
+
+SPAN_SECONDS = registry.histogram(
+    "span_duration_seconds", "Duration of traced operations", ["span"]
+)
+SPAN_ERRORS = registry.counter(
+    "span_errors_total", "Traced operations that raised", ["span"]
+)
+LLM_REQUESTS = registry.counter(
+    "llm_requests_total", "Model requests made by agent runs", ["agent"]
+)
+LLM_TOKENS = registry.counter(
+    "llm_tokens_total", "Tokens used by agent runs", ["agent", "kind"]
+)
+
+
+def record_run_usage(agent_name: str, result) -> Dict[str, int]:
+    """
+    Token usage of a pydantic_ai run result: added to the LLM counters
+    and to the current span. Cached answers count as no usage.
+    """
+    usage = {"requests": 0, "input_tokens": 0, "output_tokens": 0}
+    if not getattr(result, "cache_hit", False):
+        run_usage = result.usage()
+        usage = {
+            "requests": run_usage.requests,
+            "input_tokens": run_usage.input_tokens,
+            "output_tokens": run_usage.output_tokens,
+        }
+
+    LLM_REQUESTS.inc(usage["requests"], agent=agent_name)
+    for kind in ("input", "output"):
+        LLM_TOKENS.inc(usage[f"{kind}_tokens"], agent=agent_name, kind=kind)
+
+    current = _current_span.get()
+    if current is not None:
+        current.set(**usage)
+    return usage
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serves registry.render() on http://host:port/metrics from a daemon thread.
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+# ---------- Tracing ----------
+
+class Span:
+    """
+    One timed operation. Spans opened inside it (same task or thread,
+    or a copied context) become its children and share its trace.
+    """
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        # Finished spans of the whole trace, kept on the root
+        self.finished: List[Dict[str, Any]] = parent.finished if parent else []
+        self._started = time.perf_counter()
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "start": datetime.fromtimestamp(self.start).isoformat(),
+            "duration_ms": round(self.duration * 1000, 3),
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_trace_lock = threading.Lock()
+
+
+def _export_trace(spans: List[Dict[str, Any]]) -> None:
+    if not TRACE_FILE:
+        return
+    lines = "".join(json.dumps(s, default=str) + "\n" for s in spans)
+    with _trace_lock:
+        with open(TRACE_FILE, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times a block as a span: its duration goes to span_duration_seconds
+    and, when the root span of the trace ends, the whole trace is
+    appended to TRACE_FILE (JSON lines).
+    """
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = repr(e)
+        SPAN_ERRORS.inc(span=name)
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(current)
+
+
+def _finish(current: Span) -> None:
+    current.duration = time.perf_counter() - current._started
+    SPAN_SECONDS.observe(current.duration, span=current.name)
+    current.finished.append(current.to_dict())
+    if current.parent is None:
+        _export_trace(current.finished)
+
+
+def traced(name: str):
+    """
+    Decorator form of span() for plain functions.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def traced_iter(name: str, items: Iterable[Any], **attributes) -> Iterator[Any]:
+    """
+    span() for a stream, from the first item to the last. The duration
+    includes whatever the consumer does between items, so the span also
+    records items and busy_ms (time spent producing them). It is not
+    made current while items are out, so the consumer's own spans don't
+    nest under it.
+    """
+    current = Span(name, _current_span.get(), attributes)
+    iterator = iter(items)
+    count = 0
+    busy = 0.0
+    try:
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                busy += time.perf_counter() - started
+            count += 1
+            yield item
+    except Exception as e:
+        current.error = repr(e)
+        SPAN_ERRORS.inc(span=name)
+        raise
+    finally:
+        current.set(items=count, busy_ms=round(busy * 1000, 3))
+        _finish(current)
+
+
+def current_trace() -> Optional[Dict[str, Any]]:
+    """
+    Trace id and the spans finished so far in the current trace,
+    or None outside any span.
+    """
+    current = _current_span.get()
+    if current is None:
+        return None
+    return {"trace_id": current.trace_id, "spans": list(current.finished)}
+
+
+if METRICS_FILE:
+    atexit.register(registry.write_textfile, METRICS_FILE)
@@ -1,69 +1,44 @@
 import json
 import random
-import pandas as pd
+import argparse
 from tqdm.auto import tqdm
 from pathlib import Path
 import asyncio
-import time
 import os
-from logs import log_interaction_to_file, LOG_DIR
-from eval import eval_agent, evaluate_log_record
-from question_generation import question_generator
+from logs import log_interaction_to_file, get_log_store
+from eval import get_eval_agent, evaluate_log_record
+from question_generation import get_question_generator
 from ingest import load_raw_documents
-from chunking import chunk_documents
-from indexes import RepoIndexes
+from pipeline import load_indexes
 from tools import SearchTools
 from agent import build_agent
+from scheduler import LLMScheduler, DEFAULT_CALL_TOKENS
+from eval_runs import EvalRun
+from metrics import span, record_run_usage
 from dotenv import load_dotenv
 
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 # LOG_DIR = Path("logs")
-MAX_RPM = 4
-LLM_INTERVAL_SECONDS = 60/MAX_RPM  # 4 RPM => 1 call / 15 sec
 
-_llm_lock = asyncio.Lock()
-_last_llm_call_ts = 0.0
+# One scheduler for question generation, agent runs and evaluation,
+# so they share the RPM/TPM quota (LLM_RPM, LLM_TPM, LLM_CONCURRENCY)
+scheduler = LLMScheduler()
 
-async def llm_call(call_fn, max_retries=5):
+async def llm_call(call_fn, requests=1, tokens=DEFAULT_CALL_TOKENS):
     """
-    Global LLM call executor:
-    - Guarantees <= 4 RPM
-    - Handles retries safely
+    Global LLM call executor: rate limited (requests and tokens per
+    minute), bounded concurrency, jittered retries.
     """
-    global _last_llm_call_ts
-
-    # ---- Rate limiting (GLOBAL) ----
-    async with _llm_lock:
-        now = time.time()
-        elapsed = now - _last_llm_call_ts
-
-        if elapsed < LLM_INTERVAL_SECONDS:
-            wait_time = LLM_INTERVAL_SECONDS - elapsed
-            print(f"[RateLimit] Sleeping {wait_time:.1f}s")
-            await asyncio.sleep(wait_time)
-
-        _last_llm_call_ts = time.time()
-
-    # ---- Retry logic (outside lock) ----
-    for attempt in range(1, max_retries + 1):
-        try:
-            return await call_fn()
-        except Exception as e:
-            if attempt == max_retries:
-                raise
-            backoff = 2 ** attempt
-            print(f"[Retry {attempt}] backing off {backoff}s")
-            await asyncio.sleep(backoff)
+    return await scheduler.call(call_fn, requests=requests, tokens=tokens)
 
 
 def build_repo_agent():
-    docs = load_raw_documents()
-    chunks = chunk_documents(docs)
-    indexes = RepoIndexes(chunks)
+    indexes = load_indexes()
     tools = SearchTools(indexes)
-    agent = build_agent(tools)
+    # Every question must reach the LLM to be evaluated
+    agent = build_agent(tools, answer_cache=False)
     return agent
 
 async def generate_questions(num_questions=3):
@@ -82,110 +57,170 @@ async def generate_questions(num_questions=3):
 
     prompt = json.dumps(prompt_docs)
 
+    async def generate():
+        question_generator = get_question_generator()
+        with span("agent.run", agent=question_generator.name):
+            result = await question_generator.run(prompt)
+            record_run_usage(question_generator.name, result)
+        return result
+
     # result = await question_generator.run(prompt)
-    result = await llm_call(
-        lambda: question_generator.run(prompt)
-    )
+    result = await llm_call(generate)
     return result.output.questions
 
-async def run_agent_on_questions(agent, questions):
-    for q in tqdm(questions, desc="Running agent on questions"):
-
-        # async def call_agent():
-        #     return await agent.run(user_prompt=q)
-
-        # result = await with_retry(call_agent)
+async def answer_question(agent, question):
+    # One span per attempt, all under one trace per question
+    async def run():
+        with span("agent.run", agent=agent.name):
+            result = await agent.run(user_prompt=question)
+            record_run_usage(agent.name, result)
+        return result
 
-        result = await llm_call(
-            lambda: agent.run(user_prompt=q)
-        )
+    with span("question", source="ai-generated"):
+        # Search tool call + final answer: two model requests
+        result = await llm_call(run, requests=2)
 
-        log_interaction_to_file(
+        record, _ = log_interaction_to_file(
             agent,
             result.new_messages(),
             source="ai-generated"
         )
+    return record
 
-        # small delay to stay under free-tier QPS
-        # await asyncio.sleep(0.5)
+async def run_agent_on_questions(agent, questions):
+    return await tqdm.gather(
+        *(answer_question(agent, q) for q in questions),
+        desc="Running agent on questions"
+    )
 
 def load_ai_generated_logs():
-    records = []
+    # Served from the log store index; only matching records are read
+    return get_log_store().query(source="ai-generated")
 
-    for log_file in LOG_DIR.glob("*.json"):
-        with log_file.open("r", encoding="utf-8") as f:
-            record = json.load(f)
-            record["log_file"] = log_file
+async def evaluate_record(record):
+    eval_result = await llm_call(
+        lambda: evaluate_log_record(get_eval_agent(), record)
+    )
+    return record, eval_result
 
-            if record.get("source") == "ai-generated":
-                records.append(record)
+async def evaluate_logs(log_records):
+    return await tqdm.gather(
+        *(evaluate_record(record) for record in log_records),
+        desc="Evaluating logs"
+    )
 
-    return records
+def eval_row(log_record, eval_result):
+    messages = log_record["messages"]
 
-async def evaluate_logs(log_records):
-    results = []
+    row = {
+        "record_id": log_record["id"],
+        "question": messages[0]["parts"][0]["content"],
+        "answer": messages[-1]["parts"][0]["content"],
+        "summary": eval_result.summary,
+        # Prompt size per answered question, to compare runs
+        "input_tokens": log_record.get("usage", {}).get("input_tokens"),
+        "output_tokens": log_record.get("usage", {}).get("output_tokens"),
+    }
 
-    for record in tqdm(log_records, desc="Evaluating logs"):
-        # async def call_eval():
-        #     return await evaluate_log_record(eval_agent, record)
+    for check in eval_result.checklist:
+        row[check.check_name] = check.check_pass
 
-        # eval_result = await with_retry(call_eval)
+    return row
 
-        eval_result = await llm_call(
-            lambda: evaluate_log_record(eval_agent, record)
-        )
 
-        results.append((record, eval_result))
-        # eval can be slightly faster
-        # await asyncio.sleep(0.3)
-    return results
+# ---------- Checkpointed run steps ----------
 
-def build_eval_dataframe(eval_results):
-    rows = []
+async def answer_for_run(run, agent, question_index):
+    record = await answer_question(agent, run.questions[question_index])
+    # The log must be on disk before the checkpoint points at it; flush
+    # raises if the write failed, leaving the question pending
+    get_log_store().flush()
+    run.mark_answered(question_index, record["id"])
+    return record
 
-    for log_record, eval_result in eval_results:
-        messages = log_record["messages"]
+async def evaluate_for_run(run, record):
+    record, eval_result = await evaluate_record(record)
+    run.add_result(eval_row(record, eval_result))
 
-        row = {
-            "file": log_record["log_file"].name,
-            "question": messages[0]["parts"][0]["content"],
-            "answer": messages[-1]["parts"][0]["content"],
-        }
+async def answer_and_evaluate(run, agent, question_index):
+    # Evaluated as soon as it is answered, while other questions are
+    # still being answered
+    record = await answer_for_run(run, agent, question_index)
+    await evaluate_for_run(run, record)
 
-        for check in eval_result.checklist:
-            row[check.check_name] = check.check_pass
 
-        rows.append(row)
+async def settle(coro):
+    try:
+        return await coro
+    except Exception as e:
+        return e
 
-    return pd.DataFrame(rows)
 
+async def run_offline_eval(run_name=None, num_questions=3):
+    run = EvalRun(run_name or EvalRun.new_name())
+    print(f"Eval run {run.name} ({run.path})")
 
-async def run_offline_eval():
     print("Building agent...")
     agent = build_repo_agent()
 
-    print("Generating synthetic questions...")
-    questions = await generate_questions(num_questions=3)
-    # print(f"DEBUG: generated {len(questions)} questions")
-    print(f"Generated {len(questions)} questions")
-    print(f"passing {questions[:3]} questions")
-
-    print("Running agent on questions...")
-    await run_agent_on_questions(agent, questions[:3])
+    if run.questions is None:
+        print("Generating synthetic questions...")
+        run.set_questions(await generate_questions(num_questions=num_questions))
+    print(f"{len(run.questions)} questions: {run.questions}")
+
+    # Resuming: answered but not yet evaluated
+    store = get_log_store()
+    answered = []
+    for record_id in run.pending_records():
+        record = store.get(record_id)
+        if record is None:
+            # Checkpointed, but the log write was lost: answer it again
+            print(f"Log record {record_id} not found; answering its question again")
+            run.forget_answer(record_id)
+        else:
+            answered.append(record)
+    pending = run.pending_questions()
 
-    print("Loading AI-generated logs...")
-    log_records = load_ai_generated_logs()
+    print(
+        f"Answering {len(pending)} questions, evaluating {len(pending) + len(answered)} "
+        f"({len(run.evaluated)} already evaluated)"
+    )
+    # A call that fails for good doesn't cancel the others; everything
+    # that finished is persisted before the first error is raised, and
+    # on Ctrl-C / cancellation too
+    try:
+        outcomes = await tqdm.gather(
+            *(settle(answer_and_evaluate(run, agent, i)) for i in pending),
+            *(settle(evaluate_for_run(run, record)) for record in answered),
+            desc="Answering and evaluating"
+        )
+    finally:
+        run.flush()
+    print(f"LLM calls: {scheduler.stats()}")
 
-    print("Evaluating logs...")
-    eval_results = await evaluate_logs(log_records)
+    errors = [o for o in outcomes if isinstance(o, Exception)]
+    if errors:
+        print(f"{len(errors)} questions failed; rerun with --run {run.name} to resume")
+        raise errors[0]
 
-    df = build_eval_dataframe(eval_results)
+    df = run.results()
+    checks = [c for c in df.columns if c not in {"record_id", "question", "answer", "summary", "input_tokens", "output_tokens"}]
 
     print("\nEvaluation averages:\n")
-    print(df.mean(numeric_only=True))
+    print(df[checks].astype(float).mean())
+
+    if "input_tokens" in df.columns:
+        print(f"\nPrompt tokens per question: {df['input_tokens'].mean():.0f} (output {df['output_tokens'].mean():.0f})")
 
     print("\nSample rows:\n")
     print(df.head())
+    print(f"\nResults: {run.results_path}")
+
 
 if __name__ == "__main__":
-    asyncio.run(run_offline_eval())
+    parser = argparse.ArgumentParser(description="Offline evaluation run")
+    parser.add_argument("--run", help="run name; an existing run is resumed")
+    parser.add_argument("--questions", type=int, default=3)
+    args = parser.parse_args()
+
+    asyncio.run(run_offline_eval(args.run, args.questions))
@@ -0,0 +1,144 @@
+# pipeline.py
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+from ingest import (
+    fetch_docs_source,
+    build_manifest,
+    diff_manifests,
+    iter_markdown_documents,
+)
+from chunking import CHUNK_WORKERS, chunk_documents, submit_chunk_batch
+from indexes import RepoIndexes, INDEX_SNAPSHOT_DIR, read_snapshot_manifest
+
+DOC_BATCH_SIZE = int(os.getenv("DOC_BATCH_SIZE", 32))
+
+
+def iter_batches(items: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def prefetch(items: Iterable[Any], maxsize: int) -> Iterator[Any]:
+    """
+    Consumes items on a background thread, keeping at most maxsize
+    ready, so parsing runs ahead while the caller is embedding.
+    """
+    q = queue.Queue(maxsize=maxsize)
+    done = object()
+    errors = []
+
+    def produce():
+        try:
+            for item in items:
+                q.put(item)
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            q.put(done)
+
+    threading.Thread(target=produce, daemon=True).start()
+
+    while True:
+        item = q.get()
+        if item is done:
+            break
+        yield item
+
+    if errors:
+        raise errors[0]
+
+
+def stream_chunk_batches(
+    source: Path,
+    only: Optional[Set[str]] = None,
+    batch_size: int = DOC_BATCH_SIZE,
+    num_workers: int = CHUNK_WORKERS,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Streaming ingest -> chunk: documents are parsed on a background
+    thread and chunked in bounded batches of batch_size documents.
+    With num_workers > 1 the batches are chunked in one process pool
+    kept for the whole stream, up to 2 * num_workers batches ahead of
+    the caller; batches are yielded in input order either way.
+    """
+    def doc_batches():
+        docs = prefetch(iter_markdown_documents(source, only), maxsize=batch_size * 2)
+        return iter_batches(docs, batch_size)
+
+    if num_workers <= 1:
+        for doc_batch in doc_batches():
+            yield chunk_documents(doc_batch, num_workers=0)
+        return
+
+    with ProcessPoolExecutor(max_workers=num_workers) as pool:
+        # Workers fork on the first submit; do it before the parsing
+        # thread starts, since forking a multi-threaded process can deadlock
+        pool.submit(int).result()
+        in_flight = deque()
+        for doc_batch in doc_batches():
+            in_flight.append(submit_chunk_batch(pool, doc_batch))
+            if len(in_flight) >= num_workers * 2:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def load_indexes(snapshot_path: Path = INDEX_SNAPSHOT_DIR) -> RepoIndexes:
+    """
+    Incremental ingest -> chunk -> index:
+    - diffs the source manifest (CRC/size) against the snapshot manifest
+    - unchanged: maps the snapshot as is
+    - changed: re-chunks and re-embeds only added/changed files,
+      drops chunks of deleted files, and writes a new snapshot
+    - no usable snapshot: full streaming build
+    """
+    source = fetch_docs_source()
+    manifest = build_manifest(source)
+    # The snapshot version the diff is against, even if another process
+    # saves a new one meanwhile
+    current = Path(snapshot_path).resolve()
+    previous = read_snapshot_manifest(current)
+
+    if previous is None:
+        print("No index snapshot, building from scratch")
+        indexes = RepoIndexes.from_chunk_batches(stream_chunk_batches(source))
+        indexes.save(snapshot_path, manifest)
+        # Re-open mapped, so the build's private float32 copy is released;
+        # the model loaded for the build (if any) is kept
+        return RepoIndexes.load(
+            snapshot_path, mmap=True, model=indexes.loaded_model
+        )
+
+    added, changed, removed = diff_manifests(previous, manifest)
+
+    if not (added or changed or removed):
+        print("Docs unchanged, loading index snapshot")
+        return RepoIndexes.load(current, mmap=True)
+
+    print(
+        f"Docs changed: {len(added)} added, {len(changed)} changed, "
+        f"{len(removed)} removed"
+    )
+    indexes = RepoIndexes.load(current, mmap=True)
+    new_chunks = [
+        chunk
+        for batch in stream_chunk_batches(source, only=added | changed)
+        for chunk in batch
+    ]
+    indexes.update(new_chunks, removed_filenames=removed | changed)
+    indexes.save(snapshot_path, manifest)
+    return RepoIndexes.load(
+        snapshot_path, mmap=True, model=indexes.loaded_model
+    )
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from pydantic import BaseModel
 from pydantic_ai import Agent
 from pydantic_ai.models.gemini import GeminiModel
@@ -20,13 +21,44 @@ Generate one question for each record.
 class QuestionsList(BaseModel):
     questions: list[str]
 
-eval_model = GeminiModel(
-    model_name="gemini-2.5-flash-lite"
-)
+RETRIEVAL_QUESTION_PROMPT = """
+You are helping to build a retrieval benchmark for a search engine over a git hub repository's documentation.
 
-question_generator = Agent(
-    name="question_generator",
-    model=eval_model,
-    instructions=QUESTION_PROMPT,
-    output_type=QuestionsList,
-)
+You get a list of documentation sections. For each section, write one question that a student might ask and that this section answers.
+
+The questions should:
+
+- Be phrased the way a student would ask, in their own words
+- Not copy sentences, headings or distinctive phrases from the section; paraphrase instead
+- Be answerable from that section alone
+
+Return exactly one question per section, in the same order.
+""".strip()
+
+
+@lru_cache(maxsize=None)
+def get_eval_model() -> GeminiModel:
+    # Built on first use rather than at import
+    return GeminiModel(
+        model_name="gemini-2.5-flash-lite"
+    )
+
+
+@lru_cache(maxsize=None)
+def get_question_generator() -> Agent:
+    return Agent(
+        name="question_generator",
+        model=get_eval_model(),
+        instructions=QUESTION_PROMPT,
+        output_type=QuestionsList,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_retrieval_question_generator() -> Agent:
+    return Agent(
+        name="retrieval_question_generator",
+        model=get_eval_model(),
+        instructions=RETRIEVAL_QUESTION_PROMPT,
+        output_type=QuestionsList,
+    )
@@ -0,0 +1,164 @@
+# scheduler.py
+import os
+import re
+import time
+import random
+import asyncio
+from typing import Any, Awaitable, Callable, Optional
+
+LLM_RPM = int(os.getenv("LLM_RPM", 4))
+LLM_TPM = int(os.getenv("LLM_TPM", 250_000))
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 4))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 5))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 2))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 60))
+
+# Token estimate reserved per call before the real usage is known
+DEFAULT_CALL_TOKENS = int(os.getenv("LLM_CALL_TOKENS", 2000))
+
+_RETRY_HINT = re.compile(
+    r"(?:retryDelay|retry[-_ ]after)\W*(\d+(?:\.\d+)?)", re.IGNORECASE
+)
+
+
+class TokenBucket:
+    """
+    Async token bucket refilled with limit tokens per period seconds,
+    holding at most capacity. Waiters are served in order.
+    """
+
+    def __init__(self, limit: float, period: float = 60, capacity: Optional[float] = None):
+        self.rate = limit / period
+        # A small burst: a full period's worth on top of the refill would
+        # let up to twice the quota through a sliding window
+        self.capacity = capacity or max(1, limit / 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        # A request bigger than the bucket waits for a full bucket but
+        # is charged in full; the debt delays the callers after it
+        needed = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= needed:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((needed - self.tokens) / self.rate)
+
+    def debit(self, amount: float) -> None:
+        # Corrects an estimate after the fact; may go negative
+        self._refill()
+        self.tokens -= amount
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    return getattr(exc, "status_code", None) == 429 or "429" in str(exc)
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """
+    Server hint for when to retry: a retry_after attribute, or a
+    Retry-After / retryDelay value in the error body or message.
+    """
+    retry_after = getattr(exc, "retry_after", None)
+    if retry_after is not None:
+        return float(retry_after)
+
+    match = _RETRY_HINT.search(f"{getattr(exc, 'body', '')} {exc}")
+    return float(match.group(1)) if match else None
+
+
+class LLMScheduler:
+    """
+    Shared gate for LLM calls:
+    - token buckets for requests per minute and tokens per minute
+    - at most max_concurrency calls in flight
+    - jittered exponential backoff, waiting at least as long as a
+      429 retry-after hint asks
+    Calls that return a pydantic_ai result have their RPM/TPM estimate
+    corrected from result.usage().
+    """
+
+    def __init__(
+        self,
+        rpm: int = LLM_RPM,
+        tpm: int = LLM_TPM,
+        max_concurrency: int = LLM_CONCURRENCY,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE,
+        backoff_max: float = LLM_BACKOFF_MAX,
+        period: float = 60,
+    ):
+        # period is the quota window; only fakes use anything but a minute
+        self.requests = TokenBucket(rpm, period)
+        self.tokens = TokenBucket(tpm, period)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+        self.calls = 0
+        self.retries = 0
+        self.rate_limited = 0
+
+    def _backoff(self, attempt: int, exc: BaseException) -> float:
+        # Full jitter, so parallel callers don't retry in lockstep
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base ** attempt))
+        hint = retry_after_seconds(exc) if is_rate_limited(exc) else None
+        if hint is not None:
+            delay = hint + random.uniform(0, self.backoff_base)
+        return delay
+
+    def _record_usage(self, result: Any, requests: int, tokens: int) -> None:
+        usage = getattr(result, "usage", None)
+        if not callable(usage):
+            return
+        usage = usage()
+        self.requests.debit(getattr(usage, "requests", requests) - requests)
+        self.tokens.debit((getattr(usage, "total_tokens", None) or tokens) - tokens)
+
+    async def call(
+        self,
+        call_fn: Callable[[], Awaitable[Any]],
+        requests: int = 1,
+        tokens: int = DEFAULT_CALL_TOKENS,
+    ) -> Any:
+        """
+        Runs call_fn() once the limits allow. requests / tokens are the
+        expected cost (an agent run with a tool call is 2 requests).
+        """
+        async with self._slots:
+            for attempt in range(1, self.max_retries + 1):
+                await self.requests.acquire(requests)
+                await self.tokens.acquire(tokens)
+                try:
+                    result = await call_fn()
+                except Exception as e:
+                    if is_rate_limited(e):
+                        self.rate_limited += 1
+                    if attempt == self.max_retries:
+                        raise
+                    self.retries += 1
+                    delay = self._backoff(attempt, e)
+                    print(f"[Retry {attempt}] {type(e).__name__}, backing off {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+
+                self.calls += 1
+                self._record_usage(result, requests, tokens)
+                return result
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+        }
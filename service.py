@@ -0,0 +1,326 @@
+# service.py
+"""
+Shared retrieval service: one process holds the embedding model and the
+indexes, and any number of front-ends (Streamlit replicas, CLI) search
+through it instead of loading their own copy.
+
+    uv run service.py --port 8765
+    uv run service.py --socket /tmp/repo-search.sock
+
+Front-ends use it when SEARCH_SERVICE_URL is set, e.g.
+http://127.0.0.1:8765 or unix:///tmp/repo-search.sock
+"""
+import os
+import json
+import socket
+import asyncio
+import argparse
+import threading
+import http.client
+import socketserver
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from tools import SearchTools, SEARCH_WORKERS
+from metrics import startup, registry, PROMETHEUS_CONTENT_TYPE
+
+SEARCH_SERVICE_URL = os.getenv("SEARCH_SERVICE_URL", "")
+SEARCH_SERVICE_HOST = os.getenv("SEARCH_SERVICE_HOST", "127.0.0.1")
+SEARCH_SERVICE_PORT = int(os.getenv("SEARCH_SERVICE_PORT", 8765))
+SEARCH_SERVICE_TIMEOUT = float(os.getenv("SEARCH_SERVICE_TIMEOUT", 30))
+
+# Front-ends load the embedding model on a background thread and search
+# keyword-only until it is ready; 0 loads it before startup finishes
+BACKGROUND_MODEL_LOAD = os.getenv("BACKGROUND_MODEL_LOAD", "1") == "1"
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON over HTTP/1.1 (keep-alive):
+    - GET  /info     index version and size
+    - GET  /stats    search cache counters
+    - GET  /metrics  Prometheus metrics (span latencies, errors)
+    - POST /search   {"query" | "queries", "content_type"}
+    - POST /embed    {"query"}
+    - POST /section  {"chunk_id"}
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # One line per search would drown the server output
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        tools = self.server.search_tools
+
+        if self.path == "/metrics":
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == "/info":
+            self._send_json(200, {
+                "version": tools.version,
+                "num_chunks": len(tools.indexes.chunks),
+                "model_ready": tools.model_ready,
+            })
+        elif self.path == "/stats":
+            self._send_json(200, tools.cache_stats())
+        else:
+            self._send_json(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST(self):
+        tools = self.server.search_tools
+
+        try:
+            request = self._read_json()
+        except ValueError as e:
+            self._send_json(400, {"error": f"invalid JSON: {e}"})
+            return
+
+        try:
+            if self.path == "/search":
+                content_type = request.get("content_type")
+                if "queries" in request:
+                    results = tools.hybrid_search_many(request["queries"], content_type)
+                else:
+                    results = tools.hybrid_search(request["query"], content_type)
+                self._send_json(200, {"version": tools.version, "results": results})
+            elif self.path == "/section":
+                self._send_json(200, tools.get_section(int(request["chunk_id"])))
+            elif self.path == "/embed":
+                vector = tools._encode_query(request["query"])
+                self._send_json(200, {
+                    "version": tools.version,
+                    "vector": np.asarray(vector, dtype=np.float32).tolist(),
+                })
+            else:
+                self._send_json(404, {"error": f"unknown path {self.path}"})
+        except KeyError as e:
+            self._send_json(400, {"error": f"missing field {e}"})
+        except Exception as e:
+            self._send_json(500, {"error": repr(e)})
+
+
+class UnixSearchServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(
+    search_tools: SearchTools,
+    host: str = SEARCH_SERVICE_HOST,
+    port: int = SEARCH_SERVICE_PORT,
+    socket_path: Optional[str] = None,
+):
+    """
+    Threaded server around one SearchTools; requests share its model,
+    indexes, caches and thread pool.
+    """
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixSearchServer(socket_path, SearchRequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), SearchRequestHandler)
+        server.daemon_threads = True
+
+    server.search_tools = search_tools
+    return server
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float = SEARCH_SERVICE_TIMEOUT):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class SearchClient:
+    """
+    Thin client for a running search service. Same search interface as
+    SearchTools, so build_agent and CachedAgent take either.
+    """
+
+    def __init__(
+        self,
+        url: str = SEARCH_SERVICE_URL,
+        timeout: float = SEARCH_SERVICE_TIMEOUT,
+    ):
+        self.url = url
+        self.timeout = timeout
+        self._target = urlparse(url)
+        # One keep-alive connection per calling thread
+        self._local = threading.local()
+        self.executor = ThreadPoolExecutor(
+            max_workers=SEARCH_WORKERS, thread_name_prefix="search-client"
+        )
+
+    def _connect(self) -> http.client.HTTPConnection:
+        if self._target.scheme == "unix":
+            return UnixHTTPConnection(self._target.path, timeout=self.timeout)
+        return http.client.HTTPConnection(
+            self._target.hostname, self._target.port, timeout=self.timeout
+        )
+
+    def _request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+
+        # Retry once on a fresh connection if the kept-alive one was closed
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = self._connect()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = json.loads(response.read())
+                break
+            except (ConnectionError, http.client.HTTPException):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+        if response.status != 200:
+            raise RuntimeError(f"search service {path} failed ({response.status}): {data.get('error')}")
+        return data
+
+    @property
+    def version(self) -> str:
+        return self._request("GET", "/info")["version"]
+
+    @property
+    def model_ready(self) -> bool:
+        return self._request("GET", "/info")["model_ready"]
+
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        return self._request("GET", "/stats")
+
+    def _encode_query(self, query: str) -> np.ndarray:
+        vector = self._request("POST", "/embed", {"query": query})["vector"]
+        return np.asarray(vector, dtype=np.float32)
+
+    async def encode_query_async(self, query: str) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._encode_query, query)
+
+    def hybrid_search(self, query: str, content_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Hybrid (keyword + semantic) search over the repository docs.
+
+        Args:
+            query: The search query.
+            content_type: Optional filter, "learning" or "assignment".
+        """
+        payload = {"query": query, "content_type": content_type}
+        return self._request("POST", "/search", payload)["results"]
+
+    def get_section(self, chunk_id: int) -> Dict[str, Any]:
+        """
+        Full text of one search result, for when its snippet is not enough.
+
+        Args:
+            chunk_id: The chunk_id of a hybrid_search result.
+        """
+        return self._request("POST", "/section", {"chunk_id": chunk_id})
+
+    def hybrid_search_many(
+        self, queries: Sequence[str], content_type: Optional[str] = None
+    ) -> List[List[Dict[str, Any]]]:
+        payload = {"queries": list(queries), "content_type": content_type}
+        return self._request("POST", "/search", payload)["results"]
+
+    async def hybrid_search_async(self, query: str, content_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Hybrid (keyword + semantic) search over the repository docs.
+
+        Args:
+            query: The search query.
+            content_type: Optional filter, "learning" or "assignment".
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.hybrid_search, query, content_type
+        )
+
+
+def build_local_search_tools(background_model_load: bool = BACKGROUND_MODEL_LOAD) -> SearchTools:
+    # Imported here so client-only processes never import the index stack
+    from pipeline import load_indexes
+
+    with startup.phase("load indexes"):
+        indexes = load_indexes()
+
+    if background_model_load:
+        indexes.load_model_in_background()
+    else:
+        with startup.phase("load embedding model"):
+            indexes.embedding_model
+
+    return SearchTools(indexes)
+
+
+def build_search_tools(background_model_load: bool = BACKGROUND_MODEL_LOAD):
+    """
+    SearchClient when SEARCH_SERVICE_URL is set, else a local
+    SearchTools over freshly loaded indexes.
+    """
+    if SEARCH_SERVICE_URL:
+        with startup.phase("connect search service"):
+            client = SearchClient(SEARCH_SERVICE_URL)
+            print(f"Using search service at {SEARCH_SERVICE_URL} (index {client.version})")
+        return client
+
+    return build_local_search_tools(background_model_load)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=SEARCH_SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SEARCH_SERVICE_PORT)
+    parser.add_argument("--socket", dest="socket_path", help="serve on a Unix socket instead")
+    args = parser.parse_args()
+
+    # The service loads the model before it starts listening
+    search_tools = build_local_search_tools(background_model_load=False)
+
+    server = make_server(search_tools, args.host, args.port, args.socket_path)
+    where = args.socket_path or f"{args.host}:{args.port}"
+    startup.report()
+    print(f"Search service listening on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket_path and os.path.exists(args.socket_path):
+            os.remove(args.socket_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# snippets.py
+import os
+import re
+from typing import Any, Dict, List, Set
+
+from chunking import count_tokens
+
+# Total snippet tokens per hybrid_search call (count_tokens estimate);
+# 0 returns whole sections as before
+SEARCH_TOKEN_BUDGET = int(os.getenv("SEARCH_TOKEN_BUDGET", 600))
+# Sentences kept on each side of a sentence matching the query
+SNIPPET_CONTEXT_SENTENCES = int(os.getenv("SNIPPET_CONTEXT_SENTENCES", 1))
+
+SNIPPET_GAP = " … "
+
+_WORD_RE = re.compile(r"\w+")
+_SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does",
+    "for", "from", "how", "i", "in", "is", "it", "of", "on", "or", "the",
+    "this", "to", "what", "when", "where", "which", "who", "why", "with",
+    "you", "your",
+}
+
+
+def query_terms(query: str) -> Set[str]:
+    return {
+        word for word in _WORD_RE.findall(query.lower())
+        if word not in STOPWORDS and len(word) > 1
+    }
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s.strip() for s in _SENTENCE_RE.split(text) if s.strip()]
+
+
+def _trim_to_budget(text: str, budget: int) -> str:
+    # A single sentence over budget is cut at a word boundary
+    kept = []
+    used = 0
+    for word in text.split():
+        used += count_tokens(word)
+        if used > budget:
+            break
+        kept.append(word)
+    return " ".join(kept)
+
+
+def make_snippet(
+    text: str,
+    terms: Set[str],
+    budget: int,
+    context: int = SNIPPET_CONTEXT_SENTENCES,
+) -> str:
+    """
+    The parts of text most relevant to terms within budget tokens:
+    - the whole text if it fits
+    - else sentence windows (a matching sentence +/- context sentences),
+      best scoring first, joined in document order
+    - with no match, the opening sentences
+    """
+    if count_tokens(text) <= budget:
+        return text
+
+    sentences = split_sentences(text)
+    scores = [len(terms & set(_WORD_RE.findall(s.lower()))) for s in sentences]
+
+    # Windows around matching sentences, most query terms first; each
+    # matching sentence goes in before its neighbours
+    order = sorted(
+        (i for i, score in enumerate(scores) if score > 0),
+        key=lambda i: (-scores[i], i),
+    )
+    windows = [
+        [i] + [j for d in range(1, context + 1) for j in (i - d, i + d) if 0 <= j < len(sentences)]
+        for i in order
+    ] or [list(range(len(sentences)))]
+
+    chosen: Set[int] = set()
+    used = 0
+    for window in windows:
+        for i in window:
+            if i in chosen:
+                continue
+            cost = count_tokens(sentences[i])
+            if used + cost > budget:
+                break
+            chosen.add(i)
+            used += cost
+
+    if not chosen:
+        return _trim_to_budget(sentences[windows[0][0]], budget)
+
+    # Gaps between non-adjacent sentences are marked
+    parts = []
+    previous = None
+    for i in sorted(chosen):
+        if previous is not None and i != previous + 1:
+            parts.append(SNIPPET_GAP)
+        elif previous is not None:
+            parts.append(" ")
+        parts.append(sentences[i])
+        previous = i
+    return "".join(parts)
+
+
+def shape_results(
+    query: str,
+    results: List[Dict[str, Any]],
+    token_budget: int = SEARCH_TOKEN_BUDGET,
+) -> List[Dict[str, Any]]:
+    """
+    Fused search results as compact citations: chunk id (for
+    get_section), filename, title, content type and a snippet.
+    The token budget is shared out in rank order; what a result
+    leaves unused goes to the ones after it.
+    """
+    terms = query_terms(query)
+    shaped = []
+    remaining = token_budget
+
+    for rank, r in enumerate(results):
+        budget = max(0, remaining) // (len(results) - rank)
+        snippet = make_snippet(r["section"], terms, budget)
+        remaining -= count_tokens(snippet)
+
+        shaped.append({
+            "chunk_id": r["_id"],
+            "filename": r["filename"],
+            "title": r["title"],
+            "content_type": r["content_type"],
+            "snippet": snippet,
+            "truncated": snippet != r["section"],
+        })
+
+    return shaped
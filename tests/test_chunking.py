@@ -0,0 +1,34 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import pipeline
+
+
+def write_docs(root, count):
+    for i in range(count):
+        path = root / f"lesson{i}" / "readme.md"
+        path.parent.mkdir(parents=True)
+        sections = "\n\n".join(
+            f"## Part {j}\n\n" + f"Lesson {i} part {j} text. " * 20 for j in range(3)
+        )
+        path.write_text(f"# Lesson {i}\n\n{sections}\n", encoding="utf-8")
+
+
+def test_stream_chunks_in_one_pool_and_matches_serial(tmp_path, monkeypatch):
+    root = tmp_path / "docs"
+    write_docs(root, 12)
+
+    pools = []
+
+    class CountingPool(ProcessPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            pools.append(self)
+
+    monkeypatch.setattr(pipeline, "ProcessPoolExecutor", CountingPool)
+
+    serial = list(pipeline.stream_chunk_batches(root, batch_size=2, num_workers=0))
+    parallel = list(pipeline.stream_chunk_batches(root, batch_size=2, num_workers=2))
+
+    assert len(serial) == 6
+    assert parallel == serial
+    assert len(pools) == 1
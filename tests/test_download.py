@@ -0,0 +1,129 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ingest import download_github_zip
+
+V1 = os.urandom(200_000)
+V2 = os.urandom(150_000)
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """
+    Serves server.archive with an ETag; honours If-None-Match and
+    Range / If-Range, and cuts the body off after server.cut_after
+    bytes (once) to simulate a dropped connection.
+    """
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        body = server.archive
+        etag = f'"v{server.version}"'
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range") == etag:
+            start = int(range_header.removeprefix("bytes=").split("-")[0])
+
+        self.send_response(206 if start else 200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body) - start))
+        if start:
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        self.end_headers()
+
+        if server.cut_after is not None:
+            self.wfile.write(body[start:start + server.cut_after])
+            server.cut_after = None
+            return
+        self.wfile.write(body[start:])
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ArchiveHandler)
+    httpd.daemon_threads = True
+    httpd.archive = V1
+    httpd.version = 1
+    httpd.cut_after = None
+    httpd.requests = []
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/repo.zip"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def publish(server, archive, version):
+    server.archive = archive
+    server.version = version
+
+
+def test_fresh_download(server, tmp_path):
+    out = tmp_path / "repo.zip"
+
+    assert download_github_zip(server.url, out, chunk_size=8192) is True
+    assert out.read_bytes() == V1
+    assert not (tmp_path / "repo.zip.part").exists()
+
+
+def test_not_modified_leaves_zip_untouched(server, tmp_path):
+    out = tmp_path / "repo.zip"
+    download_github_zip(server.url, out, chunk_size=8192)
+    mtime = out.stat().st_mtime_ns
+
+    assert download_github_zip(server.url, out, chunk_size=8192) is False
+    assert server.requests[-1]["If-None-Match"] == '"v1"'
+    assert out.read_bytes() == V1
+    assert out.stat().st_mtime_ns == mtime
+
+
+def test_interrupted_download_resumes_with_range(server, tmp_path):
+    out = tmp_path / "repo.zip"
+    server.cut_after = 50_000
+
+    with pytest.raises(RuntimeError):
+        download_github_zip(server.url, out, chunk_size=8192)
+    assert not out.exists()
+    # Whole chunks received before the cut are kept
+    kept = (tmp_path / "repo.zip.part").stat().st_size
+    assert 0 < kept <= 50_000
+
+    assert download_github_zip(server.url, out, chunk_size=8192) is True
+    assert server.requests[-1]["Range"] == f"bytes={kept}-"
+    assert server.requests[-1]["If-Range"] == '"v1"'
+    assert out.read_bytes() == V1
+    assert not (tmp_path / "repo.zip.part").exists()
+
+
+def test_changed_archive_replaces_zip_atomically(server, tmp_path):
+    out = tmp_path / "repo.zip"
+    download_github_zip(server.url, out, chunk_size=8192)
+
+    # A new version whose first download is cut off: the old zip stays
+    publish(server, V2, 2)
+    server.cut_after = 40_000
+    with pytest.raises(RuntimeError):
+        download_github_zip(server.url, out, chunk_size=8192)
+    assert out.read_bytes() == V1
+
+    # The archive changes again before the resume: If-Range no longer
+    # matches, the server answers 200 and the zip is replaced whole
+    V3 = os.urandom(120_000)
+    publish(server, V3, 3)
+    assert download_github_zip(server.url, out, chunk_size=8192) is True
+    assert server.requests[-1]["If-Range"] == '"v2"'
+    assert out.read_bytes() == V3
+    assert not (tmp_path / "repo.zip.part").exists()
@@ -0,0 +1,63 @@
+import numpy as np
+
+import indexes
+from indexes import RepoIndexes
+
+DIM = 8
+
+
+class PoolModel:
+    """
+    Fake model with sentence-transformers' multi-process pool API;
+    counts pool starts / stops and the pool each encode used.
+    """
+
+    def __init__(self):
+        self.started = 0
+        self.stopped = 0
+        self.encode_pools = []
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+    def start_multi_process_pool(self, target_devices):
+        self.started += 1
+        return {"id": self.started, "processes": target_devices}
+
+    def stop_multi_process_pool(self, pool):
+        self.stopped += 1
+
+    def encode(self, texts, batch_size=32, pool=None, chunk_size=None):
+        self.encode_pools.append(pool and pool["id"])
+        return np.ones((len(texts), DIM), dtype=np.float32)
+
+
+def make_batches(num_batches, per_batch=3):
+    return [
+        [
+            {"filename": f"doc{b}.md", "content_type": "readme", "title": f"T{b}", "section": f"s{b}-{i}"}
+            for i in range(per_batch)
+        ]
+        for b in range(num_batches)
+    ]
+
+
+def test_streaming_build_starts_one_worker_pool(monkeypatch):
+    model = PoolModel()
+    monkeypatch.setattr(indexes, "load_embedding_model", lambda *args: model)
+
+    idx = RepoIndexes.from_chunk_batches(make_batches(5), num_workers=2, use_cache=False)
+
+    assert len(idx.chunks) == 15
+    assert (model.started, model.stopped) == (1, 1)
+    assert model.encode_pools == [1] * 5
+
+
+def test_single_process_build_starts_no_pool(monkeypatch):
+    model = PoolModel()
+    monkeypatch.setattr(indexes, "load_embedding_model", lambda *args: model)
+
+    RepoIndexes.from_chunk_batches(make_batches(3), num_workers=0, use_cache=False)
+
+    assert model.started == 0
+    assert model.encode_pools == [None] * 3
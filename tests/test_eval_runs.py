@@ -0,0 +1,155 @@
+import asyncio
+import re
+
+import pytest
+from pydantic_ai import Agent
+from pydantic_ai.messages import ModelResponse, TextPart, ToolCallPart
+from pydantic_ai.models.function import FunctionModel
+
+import logs
+import offline_eval
+from eval import EvaluationChecklist
+from eval_runs import EvalRun
+from log_store import LogStore
+from scheduler import LLMScheduler
+
+QUESTIONS = ["q0", "q1", "q2", "q3"]
+CHECKS = ["answer_relevant", "answer_clear"]
+
+
+class FakeLLM:
+    """
+    Stand-in answer and eval agents on FunctionModel: records which
+    questions were answered / evaluated, and fails for those in fail.
+    """
+
+    def __init__(self):
+        self.answered = []
+        self.evaluated = []
+        self.fail_answer = set()
+        self.fail_eval = set()
+
+        self.agent = Agent(FunctionModel(self._answer), name="faq_agent")
+        self.eval_agent = Agent(
+            FunctionModel(self._evaluate),
+            name="eval_agent",
+            output_type=EvaluationChecklist,
+        )
+
+    def _answer(self, messages, info):
+        question = messages[-1].parts[-1].content
+        if question in self.fail_answer:
+            raise RuntimeError(f"answer failed: {question}")
+        self.answered.append(question)
+        return ModelResponse(parts=[TextPart(f"answer to {question}")])
+
+    def _evaluate(self, messages, info):
+        prompt = messages[-1].parts[-1].content
+        question = re.search(r"<QUESTION>(.*?)</QUESTION>", prompt).group(1)
+        if question in self.fail_eval:
+            raise RuntimeError(f"eval failed: {question}")
+        self.evaluated.append(question)
+        checklist = {
+            "checklist": [
+                {"check_name": name, "justification": "ok", "check_pass": True}
+                for name in CHECKS
+            ],
+            "summary": "fine",
+        }
+        return ModelResponse(parts=[ToolCallPart(info.output_tools[0].name, checklist)])
+
+
+@pytest.fixture
+def llm(tmp_path, monkeypatch):
+    llm = FakeLLM()
+    store = LogStore(tmp_path / "logs", flush_interval=0.01)
+
+    async def generate_questions(num_questions=3):
+        return QUESTIONS
+
+    monkeypatch.setattr(logs, "_store", store)
+    monkeypatch.setattr(offline_eval, "scheduler", LLMScheduler(rpm=60_000, max_retries=1))
+    monkeypatch.setattr(offline_eval, "build_repo_agent", lambda: llm.agent)
+    monkeypatch.setattr(offline_eval, "get_eval_agent", lambda: llm.eval_agent)
+    monkeypatch.setattr(offline_eval, "generate_questions", generate_questions)
+    monkeypatch.setattr(
+        offline_eval, "EvalRun", lambda name: EvalRun(name, runs_dir=tmp_path / "runs")
+    )
+    llm.store = store
+    llm.runs_dir = tmp_path / "runs"
+    yield llm
+    store.close()
+
+
+def run_eval(name="resume"):
+    asyncio.run(offline_eval.run_offline_eval(name))
+
+
+def evaluated_questions(llm, name="resume"):
+    results = EvalRun(name, runs_dir=llm.runs_dir).results()
+    return sorted(results["question"])
+
+
+def test_resume_skips_stored_rows(llm):
+    # q1 is answered but its evaluation fails; q2 is never answered
+    llm.fail_eval = {"q1"}
+    llm.fail_answer = {"q2"}
+    with pytest.raises(RuntimeError):
+        run_eval()
+    assert evaluated_questions(llm) == ["q0", "q3"]
+
+    llm.fail_eval = set()
+    llm.fail_answer = set()
+    llm.answered.clear()
+    llm.evaluated.clear()
+    run_eval()
+
+    # Only what was not stored is redone
+    assert llm.answered == ["q2"]
+    assert sorted(llm.evaluated) == ["q1", "q2"]
+    assert evaluated_questions(llm) == QUESTIONS
+
+    llm.answered.clear()
+    llm.evaluated.clear()
+    run_eval()
+    assert llm.answered == llm.evaluated == []
+
+
+def test_missing_log_record_is_answered_again(llm):
+    # The checkpoint points at a record whose log write was lost
+    run = EvalRun("resume", runs_dir=llm.runs_dir)
+    run.set_questions(QUESTIONS)
+    run.mark_answered(0, "0123456789abcdef")
+
+    run_eval()
+
+    assert sorted(llm.answered) == QUESTIONS
+    assert evaluated_questions(llm) == QUESTIONS
+    answered = EvalRun("resume", runs_dir=llm.runs_dir).answered
+    assert answered["0"] != "0123456789abcdef"
+    assert llm.store.get(answered["0"]) is not None
+
+
+def test_failed_log_write_leaves_question_pending(llm, monkeypatch):
+    write_batch = llm.store._write_batch
+    failures = []
+
+    def failing_write_batch(db, items):
+        if not failures:
+            failures.append(items)
+            raise OSError("disk full")
+        write_batch(db, items)
+
+    monkeypatch.setattr(llm.store, "_write_batch", failing_write_batch)
+    with pytest.raises(RuntimeError, match="log store failed"):
+        run_eval()
+
+    # Three questions were checkpointed; the one whose log was lost was not
+    run = EvalRun("resume", runs_dir=llm.runs_dir)
+    assert len(run.pending_questions()) == 1
+    assert all(llm.store.get(r) is not None for r in run.answered.values())
+
+    llm.answered.clear()
+    run_eval()
+    assert len(llm.answered) == 1
+    assert evaluated_questions(llm) == QUESTIONS
@@ -0,0 +1,139 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+import indexes
+import pipeline
+from embedding_cache import EmbeddingCache
+from indexes import RepoIndexes
+from ingest import build_manifest, diff_manifests
+
+DIM = 16
+
+
+class FakeModel:
+    """
+    Deterministic stand-in for a sentence-transformers model: each
+    text maps to a vector derived from its hash.
+    """
+
+    def __init__(self):
+        self.encoded = []
+        self.loads = 0
+
+    def get_sentence_embedding_dimension(self):
+        return DIM
+
+    def encode(self, texts, batch_size=32):
+        self.encoded.extend(texts)
+        return np.stack([embed(text) for text in texts])
+
+
+def embed(text):
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(DIM).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def write_doc(root, name, title, sections):
+    path = root / name / "readme.md"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    body = "\n\n".join(f"## {heading}\n\n{text}" for heading, text in sections)
+    path.write_text(f"# {title}\n\n{body}\n", encoding="utf-8")
+
+
+@pytest.fixture
+def model():
+    return FakeModel()
+
+
+@pytest.fixture
+def docs(tmp_path, monkeypatch, model):
+    root = tmp_path / "docs"
+    monkeypatch.setattr(pipeline, "fetch_docs_source", lambda: root)
+
+    def load_embedding_model(*args):
+        model.loads += 1
+        return model
+
+    monkeypatch.setattr(indexes, "load_embedding_model", load_embedding_model)
+    monkeypatch.setattr(
+        indexes,
+        "EmbeddingCache",
+        lambda model_name: EmbeddingCache(tmp_path / "embeddings", model_name),
+    )
+    return root
+
+
+def test_incremental_update_keeps_chunk_ids_consistent(docs, model, tmp_path):
+    snapshot = tmp_path / "index"
+    write_doc(docs, "a", "Alpha", [("Setup", "Install alpha."), ("Notes", "Alpha notes.")])
+    write_doc(docs, "b", "Beta", [("Setup", "Install beta.")])
+    write_doc(docs, "c", "Gamma", [("Setup", "Install gamma."), ("Usage", "Run gamma.")])
+
+    pipeline.load_indexes(snapshot)
+    before = build_manifest(docs)
+    model.encoded.clear()
+
+    # Removed and changed files sit before and between kept ones
+    (docs / "a" / "readme.md").unlink()
+    write_doc(docs, "b", "Beta", [("Setup", "Install beta 2."), ("Tips", "Beta tips.")])
+    write_doc(docs, "d", "Delta", [("Setup", "Install delta.")])
+
+    added, changed, removed = diff_manifests(before, build_manifest(docs))
+    assert added == {"docs/d/readme.md"}
+    assert changed == {"docs/b/readme.md"}
+    assert removed == {"docs/a/readme.md"}
+
+    idx = pipeline.load_indexes(snapshot)
+
+    # Only chunks of added / changed files were embedded
+    embedded_files = {text.rsplit("\n\n", 1)[-1] for text in model.encoded}
+    assert embedded_files == {"docs/b/readme.md", "docs/d/readme.md"}
+
+    sections = {(c["filename"], c["section"]) for c in idx.chunks}
+    assert not any(f == "docs/a/readme.md" for f, _ in sections)
+    assert not any("Install beta." in s for _, s in sections)
+    assert any(f == "docs/b/readme.md" and "Beta tips." in s for f, s in sections)
+    assert any(f == "docs/c/readme.md" for f, _ in sections)
+    assert any(f == "docs/d/readme.md" for f, _ in sections)
+
+    # Row i of every index describes chunks[i]
+    vectors = np.asarray(idx.vector_index.vectors)
+    assert len(vectors) == len(idx.chunks) == len(idx.text_index.docs)
+    for i, chunk in enumerate(idx.chunks):
+        assert idx.text_index.docs[i] is chunk
+        np.testing.assert_allclose(
+            vectors[i], embed(RepoIndexes._build_text(chunk)), atol=1e-6
+        )
+        hit = idx.vector_index.search(vectors[i], num_results=1, output_ids=True)[0]
+        assert hit["_id"] == i
+        assert hit["section"] == chunk["section"]
+
+    # A fresh build over the same docs yields the same chunks
+    fresh = pipeline.load_indexes(tmp_path / "fresh")
+    assert sections == {(c["filename"], c["section"]) for c in fresh.chunks}
+
+
+def test_built_index_keeps_the_loaded_model(docs, model, tmp_path):
+    snapshot = tmp_path / "index"
+    write_doc(docs, "a", "Alpha", [("Setup", "Install alpha.")])
+
+    # Cold start: the model loaded for the build serves queries too
+    idx = pipeline.load_indexes(snapshot)
+    idx.load_model_in_background().join()
+    assert idx.embedding_model is model
+    assert model.loads == 1
+
+    # Incremental update: same again
+    write_doc(docs, "b", "Beta", [("Setup", "Install beta.")])
+    idx = pipeline.load_indexes(snapshot)
+    idx.load_model_in_background().join()
+    assert model.loads == 2
+
+    # Unchanged docs: nothing loaded until the model is needed
+    idx = pipeline.load_indexes(snapshot)
+    assert idx.loaded_model is None
+    idx.load_model_in_background().join()
+    assert model.loads == 3
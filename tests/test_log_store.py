@@ -0,0 +1,67 @@
+import json
+
+from log_store import INDEX_FILE, SEGMENT_GLOB, LogStore
+
+RECORD_BYTES = 300
+
+
+def make_record(i, source="user"):
+    # Padded so every JSON line is exactly RECORD_BYTES long
+    record = {
+        "id": f"r{i:03d}",
+        "source": source,
+        "agent_name": "faq_agent",
+        "timestamp": f"2026-01-01T00:00:{i:02d}",
+        "question": "",
+    }
+    record["question"] = "x" * (RECORD_BYTES - len(json.dumps(record)) - 1)
+    return record
+
+
+def open_store(log_dir, **kwargs):
+    kwargs.setdefault("flush_interval", 0.01)
+    return LogStore(log_dir, **kwargs)
+
+
+def test_segments_rotate_by_size(tmp_path):
+    # Room for three records per segment
+    max_mb = 3 * RECORD_BYTES / (1024 * 1024)
+    store = open_store(tmp_path, max_segment_mb=max_mb)
+    for i in range(10):
+        store.append(make_record(i, source="user" if i % 2 else "ai-generated"))
+    store.close()
+
+    segments = list(tmp_path.glob(SEGMENT_GLOB))
+    counts = sorted(len(p.read_bytes().splitlines()) for p in segments)
+    assert counts == [1, 3, 3, 3]
+
+    store = open_store(tmp_path)
+    assert [r["id"] for r in store.query()] == [f"r{i:03d}" for i in range(10)]
+    assert [r["id"] for r in store.query(source="user")] == [
+        f"r{i:03d}" for i in range(1, 10, 2)
+    ]
+    assert store.get("r007")["timestamp"] == "2026-01-01T00:00:07"
+    store.close()
+
+
+def test_rebuild_index_skips_torn_last_line(tmp_path):
+    store = open_store(tmp_path)
+    for i in range(5):
+        store.append(make_record(i))
+    store.close()
+
+    # A writer crashed mid-line, then the index was lost
+    (segment,) = tmp_path.glob(SEGMENT_GLOB)
+    with segment.open("ab") as f:
+        f.write(b'{"id": "r005", "source": "us')
+    (tmp_path / INDEX_FILE).unlink()
+
+    store = open_store(tmp_path)
+    assert [r["id"] for r in store.query()] == [f"r{i:03d}" for i in range(5)]
+    assert store.get("r005") is None
+
+    # New records go to a fresh segment and are indexed as usual
+    store.append(make_record(6))
+    assert store.get("r006")["id"] == "r006"
+    assert store.rebuild_index() == 6
+    store.close()
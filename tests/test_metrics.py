@@ -0,0 +1,28 @@
+from ingest import iter_markdown_documents
+from metrics import current_trace, span
+
+
+def test_streamed_extraction_is_traced(tmp_path):
+    root = tmp_path / "docs"
+    for name in ("a", "b", "c"):
+        path = root / name / "readme.md"
+        path.parent.mkdir(parents=True)
+        path.write_text(f"# {name}\n\ntext\n", encoding="utf-8")
+
+    with span("build") as build:
+        for doc in iter_markdown_documents(root):
+            # The consumer's spans stay children of its own span
+            with span("chunk"):
+                pass
+        spans = {s["name"]: s for s in current_trace()["spans"]}
+
+    extract = spans["ingest.extract"]
+    assert extract["parent_id"] == build.span_id
+    assert extract["attributes"] == {
+        "source": "docs",
+        "items": 3,
+        "busy_ms": extract["attributes"]["busy_ms"],
+    }
+    assert 0 <= extract["attributes"]["busy_ms"] <= extract["duration_ms"]
+    assert spans["chunk"]["parent_id"] == build.span_id
+    assert extract["error"] is None
@@ -0,0 +1,144 @@
+import time
+import asyncio
+from collections import deque
+from types import SimpleNamespace
+
+import pytest
+
+from scheduler import LLMScheduler, retry_after_seconds
+
+# Scheduler quota window; the fake API checks a slightly shorter one,
+# so timer jitter can't cause a spurious 429
+PERIOD = 0.5
+API_WINDOW = PERIOD * 0.9
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"429 Too Many Requests, retry after {retry_after:.2f}s")
+        self.retry_after = retry_after
+
+
+class FakeAPI:
+    """
+    rpm requests / tpm tokens per sliding window, else a 429; records
+    every accepted call and the calls in flight.
+    """
+
+    def __init__(self, rpm: int, tpm: int, window: float = API_WINDOW, latency: float = 0.0):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self.latency = latency
+        self.calls = deque()
+        self.accepted = []
+        self.rejected = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, requests: int = 1, tokens: int = 100):
+        now = time.monotonic()
+        while self.calls and self.calls[0][0] <= now - self.window:
+            self.calls.popleft()
+
+        used_requests = sum(r for _, r, _ in self.calls)
+        used_tokens = sum(t for _, _, t in self.calls)
+        if used_requests + requests > self.rpm or used_tokens + tokens > self.tpm:
+            self.rejected += 1
+            raise RateLimitError(self.calls[0][0] + self.window - now)
+
+        self.calls.append((now, requests, tokens))
+        self.accepted.append((now, requests, tokens))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        usage = SimpleNamespace(requests=requests, total_tokens=tokens)
+        return SimpleNamespace(usage=lambda: usage)
+
+
+def run_calls(scheduler, api, num_calls, requests=1, tokens=100, estimate=None):
+    async def main():
+        await asyncio.gather(*(
+            scheduler.call(
+                lambda: api(requests, tokens),
+                requests=requests,
+                tokens=tokens if estimate is None else estimate,
+            )
+            for _ in range(num_calls)
+        ))
+    asyncio.run(main())
+
+
+def test_multi_request_calls_stay_within_rpm():
+    # Capacity is 1 request at rpm=4; each 2-request call must still
+    # be charged both requests
+    api = FakeAPI(rpm=4, tpm=10**9)
+    scheduler = LLMScheduler(rpm=4, tpm=10**9, max_concurrency=6, max_retries=1, period=PERIOD)
+
+    run_calls(scheduler, api, num_calls=6, requests=2)
+
+    assert api.rejected == 0
+    assert scheduler.stats()["calls"] == 6
+
+
+def test_tokens_stay_within_tpm_when_estimates_are_low():
+    # Calls use 3x the reserved tokens; usage() corrects the bucket
+    api = FakeAPI(rpm=10**6, tpm=1000)
+    scheduler = LLMScheduler(rpm=10**6, tpm=1000, max_concurrency=4, max_retries=1, period=PERIOD)
+
+    run_calls(scheduler, api, num_calls=8, tokens=300, estimate=100)
+
+    assert api.rejected == 0
+    assert sum(t for _, _, t in api.accepted) == 2400
+
+
+def test_retry_after_hint_is_honoured():
+    api = FakeAPI(rpm=1, tpm=10**9, window=0.3)
+    scheduler = LLMScheduler(rpm=10**6, tpm=10**9, max_retries=3, backoff_base=0.01, period=PERIOD)
+
+    async def main():
+        await api()  # uses up the fake quota for 0.3s
+        started = time.monotonic()
+        await scheduler.call(lambda: api())
+        return time.monotonic() - started
+
+    elapsed = asyncio.run(main())
+
+    assert api.rejected == 1
+    assert elapsed >= 0.29
+    assert scheduler.stats() == {"calls": 1, "retries": 1, "rate_limited": 1}
+
+
+def test_concurrency_never_exceeds_max_concurrency():
+    api = FakeAPI(rpm=10**6, tpm=10**9, latency=0.02)
+    scheduler = LLMScheduler(rpm=10**6, tpm=10**9, max_concurrency=3, max_retries=1, period=PERIOD)
+
+    run_calls(scheduler, api, num_calls=12)
+
+    assert api.max_in_flight == 3
+
+
+def test_errors_propagate_after_max_retries():
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        raise RuntimeError("model unavailable")
+
+    scheduler = LLMScheduler(rpm=10**6, tpm=10**9, max_retries=3, backoff_base=0.01, period=PERIOD)
+
+    with pytest.raises(RuntimeError, match="model unavailable"):
+        asyncio.run(scheduler.call(failing))
+
+    assert len(attempts) == 3
+    assert scheduler.stats()["retries"] == 2
+
+
+def test_retry_after_parsed_from_error_body():
+    error = Exception('429 RESOURCE_EXHAUSTED {"retryDelay": "7s"}')
+    assert retry_after_seconds(error) == 7.0
@@ -0,0 +1,86 @@
+import threading
+
+import numpy as np
+
+import indexes
+from indexes import RepoIndexes, read_snapshot_meta
+
+
+def make_indexes(num_chunks=20, seed=0):
+    chunks = [
+        {"filename": f"doc{i}.md", "content_type": "readme", "title": f"T{i}", "section": f"section {i}"}
+        for i in range(num_chunks)
+    ]
+    vectors = np.random.default_rng(seed).standard_normal((num_chunks, 8)).astype(np.float32)
+    return RepoIndexes.from_embeddings(chunks, vectors)
+
+
+def versions(path):
+    return sorted(path.parent.glob(f"{path.name}.v-*"))
+
+
+def test_concurrent_saves_never_leave_a_gap(tmp_path):
+    path = tmp_path / "index"
+    make_indexes().save(path)
+
+    stop = threading.Event()
+    errors = []
+    missing = []
+
+    def save(seed):
+        try:
+            for _ in range(5):
+                make_indexes(seed=seed).save(path)
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        while not stop.is_set():
+            if read_snapshot_meta(path) is None:
+                missing.append(True)
+            try:
+                RepoIndexes.load(path)
+            except FileNotFoundError as e:
+                errors.append(e)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    savers = [threading.Thread(target=save, args=(seed,)) for seed in range(4)]
+    for t in savers:
+        t.start()
+    for t in savers:
+        t.join()
+    stop.set()
+    reader.join()
+
+    assert errors == []
+    assert missing == []
+    assert path.is_symlink()
+    assert RepoIndexes.load(path).chunks == make_indexes().chunks
+
+
+def test_replaced_versions_are_collected_after_grace(tmp_path, monkeypatch):
+    path = tmp_path / "index"
+    make_indexes().save(path)
+    make_indexes().save(path)
+    # Kept while a reader may still be loading them
+    assert len(versions(path)) == 2
+
+    monkeypatch.setattr(indexes, "SNAPSHOT_GC_GRACE_SECONDS", -1)
+    make_indexes().save(path)
+    assert versions(path) == [path.resolve()]
+
+
+def test_plain_directory_snapshot_is_replaced(tmp_path):
+    # Snapshots used to be a plain directory at path
+    path = tmp_path / "index"
+    make_indexes().save(path)
+    legacy = path.resolve()
+    path.unlink()
+    legacy.rename(path)
+
+    make_indexes(num_chunks=5).save(path)
+
+    assert path.is_symlink()
+    assert len(RepoIndexes.load(path).chunks) == 5
+    assert len(versions(path)) == 2
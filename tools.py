@@ -1,9 +1,101 @@
 # tools.py
-from typing import List, Any, Dict
+import os
+import asyncio
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Any, Dict, Optional, Sequence
+
+from cache import LRUCache
+from metrics import span, traced
+from snippets import SEARCH_TOKEN_BUDGET, shape_results
+from embeddings import QueryBatcher, QUERY_BATCH_MAX_SIZE, QUERY_BATCH_MAX_WAIT_MS
+
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", 8))
+SEARCH_STAGE_TIMEOUT = float(os.getenv("SEARCH_STAGE_TIMEOUT", 10))
+
+# Fused results returned to the agent, and candidates fetched per source
+SEARCH_NUM_RESULTS = int(os.getenv("SEARCH_NUM_RESULTS", 5))
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", 10))
+RRF_K = int(os.getenv("RRF_K", 60))
+TEXT_WEIGHT = float(os.getenv("SEARCH_TEXT_WEIGHT", 1.0))
+VECTOR_WEIGHT = float(os.getenv("SEARCH_VECTOR_WEIGHT", 1.0))
+
+CONTENT_TYPES = {"learning", "assignment"}
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", 1024))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", 1024))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 3600))
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def reciprocal_rank_fusion(
+    result_lists: Sequence[List[Dict[str, Any]]],
+    weights: Sequence[float],
+    k: int = RRF_K,
+) -> List[Dict[str, Any]]:
+    """
+    Scores each chunk by sum(weight / (k + rank)) over the ranked lists
+    it appears in (matched on _id) and returns them best first.
+    """
+    scores = {}
+    docs = {}
+
+    for results, weight in zip(result_lists, weights):
+        for rank, r in enumerate(results, start=1):
+            doc_id = r["_id"]
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+            docs.setdefault(doc_id, r)
+
+    ranked = sorted(scores, key=lambda doc_id: -scores[doc_id])
+    return [docs[doc_id] for doc_id in ranked]
+
 
 class SearchTools:
-    def __init__(self, indexes):
+    def __init__(
+        self,
+        indexes,
+        num_results: int = SEARCH_NUM_RESULTS,
+        num_candidates: int = SEARCH_CANDIDATES,
+        rrf_k: int = RRF_K,
+        text_weight: float = TEXT_WEIGHT,
+        vector_weight: float = VECTOR_WEIGHT,
+        stage_timeout: float = SEARCH_STAGE_TIMEOUT,
+        query_cache_size: int = QUERY_CACHE_SIZE,
+        result_cache_size: int = RESULT_CACHE_SIZE,
+        cache_ttl: float = SEARCH_CACHE_TTL,
+        query_batch_size: int = QUERY_BATCH_MAX_SIZE,
+        query_batch_wait_ms: float = QUERY_BATCH_MAX_WAIT_MS,
+        token_budget: int = SEARCH_TOKEN_BUDGET,
+    ):
         self.indexes = indexes
+        self.num_results = num_results
+        self.num_candidates = num_candidates
+        self.rrf_k = rrf_k
+        self.text_weight = text_weight
+        self.vector_weight = vector_weight
+        self.stage_timeout = stage_timeout
+        self.token_budget = token_budget
+
+        # Keyed by normalized query; both dropped when indexes.version changes
+        self.query_cache = LRUCache(query_cache_size, cache_ttl)
+        self.result_cache = LRUCache(result_cache_size, cache_ttl)
+        self._cache_version = indexes.version
+        self._cache_lock = threading.Lock()
+        # Shared by all sessions; encoding and numpy release the GIL
+        self.executor = ThreadPoolExecutor(
+            max_workers=SEARCH_WORKERS, thread_name_prefix="search"
+        )
+        # Concurrent cache misses share one forward pass
+        self.query_batcher = None
+        if query_batch_size > 1:
+            self.query_batcher = QueryBatcher(
+                self._encode_batch, query_batch_size, query_batch_wait_ms
+            )
 
     # def search_learning(self, query: str) -> List[Any]:
     #     return self.indexes.text_index.search(
@@ -19,32 +111,224 @@ class SearchTools:
     #         filters={"content_type": "assignment"}
     #     )
 
-    def hybrid_search(self, query: str) -> List[Dict[str, Any]]:
-        """
-        Hybrid search with intent-aware filtering and safe deduplication.
-        """
-        
-        # Keyword search
-        text_results = self.indexes.text_index.search(
+    @property
+    def version(self) -> str:
+        return self.indexes.version
+
+    @property
+    def model_ready(self) -> bool:
+        # Until the embedding model has loaded, searches are keyword-only
+        return self.indexes.model_ready
+
+    def _check_cache_version(self) -> None:
+        with self._cache_lock:
+            if self._cache_version != self.indexes.version:
+                self.query_cache.clear()
+                self.result_cache.clear()
+                self._cache_version = self.indexes.version
+
+    def _result_key(self, query: str, content_type: Optional[str]):
+        return (normalize_query(query), content_type, self.indexes.version)
+
+    def _cached_results(self, query: str, content_type: Optional[str]):
+        self._check_cache_version()
+        results = self.result_cache.get(self._result_key(query, content_type))
+        return list(results) if results is not None else None
+
+    def _cache_results(self, query: str, content_type: Optional[str], results) -> None:
+        self.result_cache.put(self._result_key(query, content_type), list(results))
+
+    def cache_stats(self) -> Dict[str, Dict[str, Any]]:
+        stats = {
+            "query_embeddings": self.query_cache.stats(),
+            "results": self.result_cache.stats(),
+        }
+        if self.query_batcher is not None:
+            stats["query_batches"] = self.query_batcher.stats()
+        return stats
+
+    def _filters(self, content_type: Optional[str]) -> Dict[str, Any]:
+        if content_type in CONTENT_TYPES:
+            return {"content_type": content_type}
+        return {}
+
+    @traced("search.text")
+    def _text_search(self, query: str, content_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        return self.indexes.text_index.search(
             query,
-            num_results=5
+            filter_dict=self._filters(content_type),
+            num_results=self.num_candidates,
+            output_ids=True,
         )
 
-        # Vector search
-        query_vec = self.indexes.embedding_model.encode(query)
-        vector_results = self.indexes.vector_index.search(
+    @traced("search.encode")
+    def _encode_query(self, query: str):
+        key = (normalize_query(query), self.indexes.version)
+        query_vec = self.query_cache.get(key)
+        if query_vec is None:
+            if self.query_batcher is not None:
+                query_vec = self.query_batcher.encode(key[0])
+            else:
+                query_vec = self.indexes.embedding_model.encode(key[0])
+            self.query_cache.put(key, query_vec)
+        return query_vec
+
+    def _encode_batch(self, texts: List[str]):
+        return self.indexes.embedding_model.encode(texts)
+
+    def _encode_queries(self, queries: Sequence[str]) -> None:
+        # One batched forward pass for the queries not cached yet
+        if not self.model_ready:
+            return
+        self._check_cache_version()
+        version = self.indexes.version
+        texts = list(dict.fromkeys(normalize_query(q) for q in queries))
+        missing = [t for t in texts if self.query_cache.get((t, version)) is None]
+        if missing:
+            vectors = self._encode_batch(missing)
+            for text, query_vec in zip(missing, vectors):
+                self.query_cache.put((text, version), query_vec)
+
+    @traced("search.vector")
+    def _vector_search(self, query_vec, content_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        return self.indexes.vector_index.search(
             query_vec,
-            num_results=5
+            filter_dict=self._filters(content_type),
+            num_results=self.num_candidates,
+            output_ids=True,
+        )
+
+    def _merge(self, text_results, vector_results) -> List[Dict[str, Any]]:
+        # One ranked list via reciprocal rank fusion, truncated
+        fused = reciprocal_rank_fusion(
+            [text_results, vector_results],
+            [self.text_weight, self.vector_weight],
+            k=self.rrf_k,
+        )
+        return fused[:self.num_results]
+
+    def _shape(self, query: str, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Snippets within the token budget instead of whole sections
+        if self.token_budget <= 0:
+            return results
+        return shape_results(query, results, self.token_budget)
+
+    def get_section(self, chunk_id: int) -> Dict[str, Any]:
+        """
+        Full text of one search result, for when its snippet is not enough.
+
+        Args:
+            chunk_id: The chunk_id of a hybrid_search result.
+        """
+        chunks = self.indexes.chunks
+        if not 0 <= chunk_id < len(chunks):
+            return {"error": f"unknown chunk_id {chunk_id}; search again"}
+
+        chunk = chunks[chunk_id]
+        return {
+            "chunk_id": chunk_id,
+            "filename": chunk["filename"],
+            "title": chunk["title"],
+            "content_type": chunk["content_type"],
+            "section": chunk["section"],
+        }
+
+    def hybrid_search(self, query: str, content_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Hybrid (keyword + semantic) search over the repository docs.
+
+        Args:
+            query: The search query.
+            content_type: Optional filter, "learning" or "assignment".
+        """
+        with span("hybrid_search", content_type=content_type) as current:
+            cached = self._cached_results(query, content_type)
+            current.set(cache_hit=cached is not None)
+            if cached is not None:
+                return cached
+
+            # Keyword search
+            text_results = self._text_search(query, content_type)
+
+            if not self.model_ready:
+                return self._shape(query, self._merge(text_results, []))
+
+            # Vector search
+            vector_results = self._vector_search(self._encode_query(query), content_type)
+
+            results = self._shape(query, self._merge(text_results, vector_results))
+            self._cache_results(query, content_type, results)
+            return results
+
+    def hybrid_search_many(
+        self, queries: Sequence[str], content_type: Optional[str] = None
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        hybrid_search for several queries at once; the query embeddings
+        are computed in one batch.
+        """
+        self._encode_queries(queries)
+        return [self.hybrid_search(query, content_type) for query in queries]
+
+    async def _run_stage(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        # Run in a copy of this context, so stage spans join the trace
+        context = contextvars.copy_context()
+        return await asyncio.wait_for(
+            loop.run_in_executor(self.executor, functools.partial(context.run, fn, *args)),
+            timeout=self.stage_timeout,
         )
 
-        #  Merge + deduplicate by *section*, not file
-        seen = set()
-        combined = []
+    async def _vector_stages(self, query: str, content_type: Optional[str]) -> List[Dict[str, Any]]:
+        query_vec = await self._run_stage(self._encode_query, query)
+        return await self._run_stage(self._vector_search, query_vec, content_type)
+
+    async def encode_query_async(self, query: str):
+        return await self._run_stage(self._encode_query, query)
+
+    async def hybrid_search_async(self, query: str, content_type: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Hybrid (keyword + semantic) search over the repository docs.
+
+        Args:
+            query: The search query.
+            content_type: Optional filter, "learning" or "assignment".
+        """
+        with span("hybrid_search", content_type=content_type) as current:
+            cached = self._cached_results(query, content_type)
+            current.set(cache_hit=cached is not None)
+            if cached is not None:
+                return cached
+
+            if not self.model_ready:
+                text_results = await self._run_stage(self._text_search, query, content_type)
+                return self._shape(query, self._merge(text_results, []))
+
+            # Keyword search and query encoding + vector search run
+            # concurrently off the event loop, each stage with a timeout
+            text_results, vector_results = await asyncio.gather(
+                self._run_stage(self._text_search, query, content_type),
+                self._vector_stages(query, content_type),
+                return_exceptions=True,
+            )
+
+            if isinstance(text_results, Exception) and isinstance(vector_results, Exception):
+                raise text_results
 
-        for r in text_results + vector_results:
-            key = (r.get("filename"), r.get("title"))
-            if key not in seen:
-                seen.add(key)
-                combined.append(r)
+            # A failed or timed-out side degrades to the other one
+            # (and the partial result is not cached)
+            degraded = False
+            if isinstance(text_results, Exception):
+                print(f"[Search] keyword search failed: {text_results!r}")
+                text_results = []
+                degraded = True
+            if isinstance(vector_results, Exception):
+                print(f"[Search] vector search failed: {vector_results!r}")
+                vector_results = []
+                degraded = True
+            current.set(degraded=degraded)
 
-        return combined
+            results = self._shape(query, self._merge(text_results, vector_results))
+            if not degraded:
+                self._cache_results(query, content_type, results)
+            return results
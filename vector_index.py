@@ -0,0 +1,354 @@
+# vector_index.py
+import os
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Any, Optional
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "auto")
+
+# Below this many chunks "auto" uses exact search
+ANN_MIN_CHUNKS = int(os.getenv("ANN_MIN_CHUNKS", 20000))
+IVF_PROBES = int(os.getenv("IVF_PROBES", 8))
+
+# Storage used for the scan: float32, float16 or int8 (per-vector scale)
+VECTOR_DTYPE = os.getenv("VECTOR_DTYPE", "float32")
+# Re-score this many top candidates with the float32 vectors (0 = off)
+VECTOR_RERANK = int(os.getenv("VECTOR_RERANK", 0))
+
+SCAN_BLOCK_ROWS = 16384
+
+KMEANS_ITERATIONS = 10
+KMEANS_MAX_TRAINING_ROWS = 50000
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    Unit-length rows, so dot product == cosine similarity.
+    Already normalized input (e.g. mpnet output) is returned as is,
+    which keeps memory-mapped matrices shared.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.size == 0:
+        return vectors
+    norms = np.linalg.norm(vectors, axis=1)
+    if np.allclose(norms, 1.0, atol=1e-3):
+        return vectors
+    return vectors / np.maximum(norms, 1e-12)[:, None]
+
+
+def quantize(vectors: np.ndarray, dtype: str):
+    """
+    Returns (codes, scales) used for scanning:
+    - float32: the vectors themselves, no scales
+    - float16: half precision copy, no scales
+    - int8: round(v / max|v| * 127) with one float32 scale per vector
+    """
+    if dtype == "float32":
+        return vectors, None
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1).astype(np.float32) if len(vectors) else np.empty(0, np.float32)
+        scales = np.maximum(scales, 1e-12)
+        codes = np.round(vectors / scales[:, None] * 127).astype(np.int8)
+        return codes, scales / 127
+    raise ValueError(f"Unknown vector dtype: {dtype}")
+
+
+class ExactVectorIndex:
+    """
+    Brute-force cosine search over all vectors.
+    Same search() interface as minsearch.VectorSearch.
+
+    With dtype float16/int8 the scan runs over a quantized copy and,
+    if rerank > 0, the top rerank candidates are re-scored with the
+    float32 vectors (memory-mapped when loaded from a snapshot, so
+    only those rows are paged in).
+    """
+
+    name = "exact"
+
+    def __init__(
+        self,
+        keyword_fields: Optional[List[str]] = None,
+        dtype: str = VECTOR_DTYPE,
+        rerank: int = VECTOR_RERANK,
+    ):
+        self.keyword_fields = keyword_fields or []
+        self.dtype = dtype
+        self.rerank = rerank
+        self.vectors = None
+        self.codes = None
+        self.scales = None
+        self.docs = []
+
+    def fit(self, vectors: np.ndarray, docs: List[Dict[str, Any]]):
+        if len(vectors) != len(docs):
+            raise ValueError("Number of vectors must match number of payload documents")
+        self.vectors = _normalize(vectors)
+        self.codes, self.scales = quantize(self.vectors, self.dtype)
+        self.docs = docs
+        return self
+
+    def add(self, vectors: np.ndarray, docs: List[Dict[str, Any]]):
+        """
+        Appends vectors without touching the existing ones.
+        """
+        if self.vectors is None or len(self.vectors) == 0:
+            return self.fit(vectors, list(docs))
+        vectors = _normalize(vectors)
+        codes, scales = quantize(vectors, self.dtype)
+        self.vectors = np.vstack([self.vectors, vectors])
+        if self.dtype != "float32":
+            self.codes = np.concatenate([self.codes, codes])
+        else:
+            self.codes = self.vectors
+        if scales is not None:
+            self.scales = np.concatenate([self.scales, scales])
+        self.docs = self.docs + list(docs)
+        return self
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Resident size of the scanned arrays.
+        """
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def _scan(self, query_vector: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """
+        Approximate scores over the quantized codes, block by block so
+        the float32 upcast never covers the whole matrix.
+        """
+        n = len(self.docs) if rows is None else len(rows)
+        if self.dtype == "float32":
+            codes = self.codes if rows is None else self.codes[rows]
+            return codes @ query_vector
+
+        scores = np.empty(n, dtype=np.float32)
+        for start in range(0, n, SCAN_BLOCK_ROWS):
+            end = min(start + SCAN_BLOCK_ROWS, n)
+            block = self.codes[start:end] if rows is None else self.codes[rows[start:end]]
+            scores[start:end] = block.astype(np.float32) @ query_vector
+        if self.scales is not None:
+            scores *= self.scales if rows is None else self.scales[rows]
+        return scores
+
+    def _filter_mask(self, filter_dict: Dict[str, Any], rows: np.ndarray) -> np.ndarray:
+        mask = np.ones(len(rows), dtype=bool)
+        for field, value in filter_dict.items():
+            if field in self.keyword_fields:
+                mask &= np.array([self.docs[i].get(field) == value for i in rows])
+        return mask
+
+    def _candidates(self, query_vector: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Rows to score; None means all of them.
+        """
+        return None
+
+    def search(
+        self,
+        query_vector: np.ndarray,
+        filter_dict: Optional[Dict[str, Any]] = None,
+        num_results: int = 10,
+        output_ids: bool = False,
+    ) -> List[Dict[str, Any]]:
+        if not self.docs or self.vectors is None:
+            return []
+
+        query_vector = _normalize(np.asarray(query_vector).reshape(1, -1))[0]
+
+        rows = self._candidates(query_vector)
+        scores = self._scan(query_vector, rows)
+        if rows is None:
+            rows = np.arange(len(self.docs))
+
+        if filter_dict:
+            mask = self._filter_mask(filter_dict, rows)
+            rows, scores = rows[mask], scores[mask]
+
+        if len(rows) == 0:
+            return []
+
+        if self.rerank and self.dtype != "float32" and len(rows) > num_results:
+            n_candidates = min(max(self.rerank, num_results), len(rows))
+            candidates = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+            # Sorted rows keep reads of a memory-mapped matrix sequential
+            rows = np.sort(rows[candidates])
+            scores = self.vectors[rows] @ query_vector
+
+        k = min(num_results, len(rows))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        if output_ids:
+            return [{**self.docs[i], "_id": int(i)} for i in rows[top]]
+        return [self.docs[i] for i in rows[top]]
+
+    def save(self, path: Path) -> None:
+        path = Path(path)
+        np.save(path / "embeddings.npy", self.vectors)
+        if self.dtype != "float32":
+            np.save(path / f"vectors_{self.dtype}.npy", self.codes)
+        if self.scales is not None:
+            np.save(path / "vector_scales.npy", self.scales)
+
+    def _load_arrays(self, path: Path, mmap_mode: Optional[str]) -> None:
+        if self.dtype == "float32":
+            self.codes = self.vectors
+            return
+        self.codes = np.load(path / f"vectors_{self.dtype}.npy", mmap_mode=mmap_mode)
+        if self.dtype == "int8":
+            self.scales = np.load(path / "vector_scales.npy", mmap_mode=mmap_mode)
+
+    @classmethod
+    def load(
+        cls,
+        path: Path,
+        docs: List[Dict[str, Any]],
+        keyword_fields: Optional[List[str]] = None,
+        mmap: bool = True,
+        **params,
+    ):
+        mmap_mode = "r" if mmap else None
+        index = cls(keyword_fields=keyword_fields, **params)
+        index.vectors = np.load(Path(path) / "embeddings.npy", mmap_mode=mmap_mode)
+        index.docs = docs
+        index._load_arrays(Path(path), mmap_mode)
+        return index
+
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means on (a sample of) unit vectors; returns centroids.
+    """
+    rng = np.random.default_rng(seed)
+    if len(vectors) > KMEANS_MAX_TRAINING_ROWS:
+        sample = rng.choice(len(vectors), KMEANS_MAX_TRAINING_ROWS, replace=False)
+        vectors = vectors[np.sort(sample)]
+    vectors = np.asarray(vectors, dtype=np.float32)
+
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(k):
+            members = vectors[assign == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+            else:
+                # Re-seed empty clusters
+                centroids[c] = vectors[rng.integers(len(vectors))]
+        centroids = _normalize(centroids)
+    return centroids
+
+
+class IVFVectorIndex(ExactVectorIndex):
+    """
+    Inverted-file ANN index: vectors are grouped under k-means
+    centroids and a query only scores the n_probe closest groups.
+    """
+
+    name = "ivf"
+
+    def __init__(
+        self,
+        keyword_fields: Optional[List[str]] = None,
+        dtype: str = VECTOR_DTYPE,
+        rerank: int = VECTOR_RERANK,
+        n_lists: Optional[int] = None,
+        n_probe: int = IVF_PROBES,
+    ):
+        super().__init__(keyword_fields, dtype, rerank)
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.centroids = None
+        self.assignments = None
+        self.list_rows = None
+        self.list_offsets = None
+
+    def fit(
+        self,
+        vectors: np.ndarray,
+        docs: List[Dict[str, Any]],
+        centroids: Optional[np.ndarray] = None,
+    ):
+        """
+        Trains centroids (unless given, e.g. from a previous build)
+        and builds the inverted lists.
+        """
+        super().fit(vectors, docs)
+        if len(self.docs) == 0:
+            return self
+
+        if centroids is None:
+            n_lists = self.n_lists or max(1, int(np.sqrt(len(self.docs))))
+            centroids = kmeans(self.vectors, min(n_lists, len(self.docs)))
+        self.centroids = centroids
+        self.assignments = self._assign(self.vectors)
+        self._build_lists()
+        return self
+
+    def add(self, vectors: np.ndarray, docs: List[Dict[str, Any]]):
+        """
+        Appends vectors to the nearest existing lists (no retraining).
+        """
+        if self.centroids is None:
+            return self.fit(vectors, list(docs))
+        n_before = len(self.docs)
+        super().add(vectors, docs)
+        new_assignments = self._assign(self.vectors[n_before:])
+        self.assignments = np.concatenate([self.assignments, new_assignments])
+        self._build_lists()
+        return self
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), 8192):
+            block = vectors[start:start + 8192]
+            assignments[start:start + 8192] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignments
+
+    def _build_lists(self) -> None:
+        self.list_rows = np.argsort(self.assignments, kind="stable").astype(np.int64)
+        counts = np.bincount(self.assignments, minlength=len(self.centroids))
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def _candidates(self, query_vector: np.ndarray) -> Optional[np.ndarray]:
+        if self.centroids is None:
+            return None
+        n_probe = min(self.n_probe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ query_vector), n_probe - 1)[:n_probe]
+        return np.concatenate([
+            self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]]
+            for c in probes
+        ])
+
+    def save(self, path: Path) -> None:
+        super().save(path)
+        path = Path(path)
+        np.save(path / "ivf_centroids.npy", self.centroids)
+        np.save(path / "ivf_assignments.npy", self.assignments)
+
+    def _load_arrays(self, path: Path, mmap_mode: Optional[str]) -> None:
+        super()._load_arrays(path, mmap_mode)
+        self.centroids = np.load(path / "ivf_centroids.npy")
+        self.assignments = np.load(path / "ivf_assignments.npy", mmap_mode=mmap_mode)
+        self._build_lists()
+
+
+VECTOR_BACKENDS = {
+    ExactVectorIndex.name: ExactVectorIndex,
+    IVFVectorIndex.name: IVFVectorIndex,
+}
+
+
+def resolve_backend(num_vectors: int, backend: str = VECTOR_BACKEND) -> str:
+    """
+    "auto" picks exact search for small corpora and IVF for large ones.
+    """
+    if backend == "auto":
+        return IVFVectorIndex.name if num_vectors >= ANN_MIN_CHUNKS else ExactVectorIndex.name
+    if backend not in VECTOR_BACKENDS:
+        raise ValueError(f"Unknown vector backend: {backend}")
+    return backend